@@ -0,0 +1,149 @@
+"""
+Batch EXIF stamping, shared by ReadImageAndModifyExif.py and WriteToJpgExifAndGenPhotoLog.py.
+
+The scripts parsed each JPEG with the exif library (which loads the whole file into its object model), set the tags
+and wrote the whole file back with get_file(), and opened the matching txt file of every photo on its own.
+Here the Txt_log folder is read into one in-memory index first ({photo name without extension: lines}), and for each
+photo only the Exif APP1 segment is rewritten: the header segments are read, the existing Exif data is loaded with
+piexif and updated, and the new file is SOI + the header segments + the new APP1 segment + the rest of the original
+file, copied as raw bytes. The image data is never parsed or decoded. A thread pool runs the photos, the work is file I/O.
+
+Each script passes its own build_tags(name, text_lines) function, returning {ifd name: {tag: value}} in piexif
+form ("0th", "Exif", "GPS"), or None to leave the photo out.
+"""
+
+import os
+import struct
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import piexif
+
+# Largest payload of a JPEG segment, the 2 length bytes count themselves
+MAX_SEGMENT_SIZE = 65533
+
+
+def read_text_file(text_path, max_lines=None):
+    with open(text_path, 'r') as text_file:
+        lines = text_file.read().splitlines()
+    return lines[:max_lines] if max_lines else lines
+
+
+def load_text_log_index(text_folder, max_lines=None, workers=16):
+    """
+    Read every txt file of the folder once and return {file name without extension: list of lines}.
+    """
+    names = [entry.name for entry in os.scandir(text_folder) if entry.is_file() and entry.name.lower().endswith('.txt')]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        contents = executor.map(lambda name: read_text_file(os.path.join(text_folder, name), max_lines), names)
+        return {os.path.splitext(name)[0]: lines for name, lines in zip(names, contents)}
+
+
+def dms_to_rationals(dms):
+    """
+    Convert a (degrees, minutes, seconds) tuple to the EXIF rationals of GPSLatitude / GPSLongitude.
+    """
+    degrees, minutes, seconds = dms
+    return ((int(degrees), 1), (int(minutes), 1), (int(round(seconds * 10000)), 10000))
+
+
+def float_to_rational(value, denominator=100):
+    return (int(round(value * denominator)), denominator)
+
+
+def read_header_segments(jpeg_file):
+    """
+    Read the marker segments of an open JPEG up to the start of the image data.
+    Return (header bytes without SOI and the Exif APP1 segment, Exif TIFF bytes or b"", insert position in the
+    header bytes for the new APP1 segment, file offset where the raw copy starts).
+    The first Exif APP1 segment is always taken out, wherever it is, and the new one goes in its place. Without one,
+    the new segment goes after the JFIF APP0 segment(s).
+    """
+    if jpeg_file.read(2) != b"\xff\xd8":
+        raise ValueError("Not a JPEG file")
+    header = bytearray()
+    tiff = None
+    exif_position = None
+    after_app0_position = None
+    while True:
+        marker_offset = jpeg_file.tell()
+        prefix = jpeg_file.read(2)
+        if len(prefix) < 2 or prefix[0] != 0xFF or prefix[1] in (0xD9, 0xDA):
+            # Start of the image data (or a stream this reader does not know), copy from here on as it is
+            if exif_position is not None:
+                insert_position = exif_position
+            elif after_app0_position is not None:
+                insert_position = after_app0_position
+            else:
+                insert_position = len(header)
+            return bytes(header), tiff or b"", insert_position, marker_offset
+        length_bytes = jpeg_file.read(2)
+        length = struct.unpack(">H", length_bytes)[0]
+        payload = jpeg_file.read(length - 2)
+        if prefix[1] == 0xE1 and payload.startswith(b"Exif\x00\x00") and tiff is None:
+            # The new segment goes where the old one was
+            tiff = payload[6:]
+            exif_position = len(header)
+            continue
+        if prefix[1] != 0xE0 and after_app0_position is None:
+            after_app0_position = len(header)
+        header += prefix + length_bytes + payload
+
+
+def build_app1_segment(exif_dict):
+    exif_bytes = piexif.dump(exif_dict)
+    if len(exif_bytes) > MAX_SEGMENT_SIZE:
+        # A large embedded thumbnail does not fit next to the new tags, the photo does not need it
+        exif_dict.pop("thumbnail", None)
+        exif_dict["1st"] = {}
+        exif_bytes = piexif.dump(exif_dict)
+    if len(exif_bytes) > MAX_SEGMENT_SIZE:
+        # A large MakerNote or UserComment, the Exif data can not be split over several APP1 segments
+        raise ValueError(f"Exif data of {len(exif_bytes)} bytes does not fit in one APP1 segment ({MAX_SEGMENT_SIZE} bytes)")
+    return b"\xff\xe1" + struct.pack(">H", len(exif_bytes) + 2) + exif_bytes
+
+
+def stamp_exif(input_path, output_path, tags):
+    """
+    Write a copy of the JPEG at input_path to output_path with the tags ({ifd name: {tag: value}}) set,
+    rewriting only the Exif APP1 segment.
+    """
+    with open(input_path, 'rb') as jpeg_file:
+        header, tiff, insert_position, data_offset = read_header_segments(jpeg_file)
+        exif_dict = piexif.load(b"Exif\x00\x00" + tiff) if tiff else {"0th": {}, "Exif": {}, "GPS": {}, "1st": {}, "thumbnail": None}
+        for ifd_name, ifd_tags in tags.items():
+            exif_dict.setdefault(ifd_name, {}).update(ifd_tags)
+        app1 = build_app1_segment(exif_dict)
+
+        jpeg_file.seek(data_offset)
+        with open(output_path, 'wb') as output_file:
+            output_file.write(b"\xff\xd8" + header[:insert_position] + app1 + header[insert_position:])
+            shutil.copyfileobj(jpeg_file, output_file, 1024 * 1024)
+
+
+def stamp_folder(photos_folder, new_photo_folder, text_index, build_tags, jpg_files=None, workers=16):
+    """
+    Stamp every JPEG of photos_folder with the tags from build_tags(name, text_lines) and save it under the same
+    name in new_photo_folder. Photos without a txt file in text_index, and photos that can not be stamped (not a JPEG,
+    Exif data too large for one segment), are skipped with a message. Returns the written file names.
+    """
+    if jpg_files is None:
+        jpg_files = [file for file in os.listdir(photos_folder) if file.endswith('.jpg') and not file.lower().endswith('jpg.meta')]
+    os.makedirs(new_photo_folder, exist_ok=True)
+
+    def stamp_one(jpg_file):
+        name = os.path.splitext(jpg_file)[0]
+        if name not in text_index:
+            print(f"No txt file for {jpg_file}, skipped")
+            return None
+        tags = build_tags(name, text_index[name])
+        if tags is None:
+            return None
+        try:
+            stamp_exif(os.path.join(photos_folder, jpg_file), os.path.join(new_photo_folder, name + '.jpg'), tags)
+        except ValueError as e:
+            print(f"Could not stamp {jpg_file}: {e}, skipped")
+            return None
+        return name + '.jpg'
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return [written for written in executor.map(stamp_one, jpg_files) if written]
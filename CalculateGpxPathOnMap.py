@@ -17,10 +17,25 @@ To use this:
 """
 
 import os
+import io
 import csv
 import math
+import time
+import itertools
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
 import gpxpy
 from pyproj import CRS, Transformer
+from GpxStreamReader import iter_point_chunks, iter_raw_points, parse_gpx_time
+
+FIELDNAMES = [
+    "count", "latitude", "longitude", "elevationM", "timestamp",
+    "northing", "easting", "elevationFt", "positionX", "positionY",
+    "positionZ", "xdimM", "ydimM", "filename"
+]
 
 def read_latlong_file(filename):
     """
@@ -107,24 +122,211 @@ def process_gpx_file(gpx_file, transformer, min_lat, min_lon, min_x, min_y):
     
     return points
 
-def main():
+def build_segment_columns(count, latitudes, longitudes, elevations, times, transformer, min_x, min_y, map_width, map_height, name):
+    """
+    Project one track segment with a single Transformer.transform call on the arrays and
+    return its columns. Array columns hold one value per point, the constant columns are plain scalars.
+    Missing elevations are NaN, timestamps are datetime64[ms].
+    """
+    pos_x, pos_y = transformer.transform(latitudes, longitudes)
+    return {
+        "count": count,
+        "latitude": latitudes,
+        "longitude": longitudes,
+        "elevationM": elevations,
+        "timestamp": times.astype("datetime64[ms]"),
+        "northing": 0,
+        "easting": 0,
+        "elevationFt": 0,
+        "positionX": np.asarray(pos_x) - min_x,
+        "positionY": np.asarray(pos_y) - min_y,
+        "positionZ": elevations,
+        "xdimM": map_width,
+        "ydimM": map_height,
+        "filename": name
+    }
+
+def process_gpx_file_vectorized(gpx_file, transformer, min_x, min_y, map_width, map_height, chunk_size=65536):
+    """
+    Batched version of process_gpx_file. Reads the track points with the streaming reader (GpxStreamReader)
+    in chunks of at most chunk_size points of one segment, and yields the columns of each chunk (see build_segment_columns).
+    Points without a timestamp are skipped, like in process_gpx_file.
+    """
+    if not os.path.isfile(gpx_file):
+        raise FileNotFoundError(f"{gpx_file} not found.")
+    
+    name = os.path.splitext(os.path.basename(gpx_file))[0]
+    segment_offsets = {}
+    try:
+        for segment_index, latitudes, longitudes, elevations, times in iter_point_chunks(gpx_file, chunk_size):
+            # count restarts at 0 in every segment, continue it over the chunks of the same segment
+            offset = segment_offsets.get(segment_index, 0)
+            segment_offsets[segment_index] = offset + len(latitudes)
+            count = np.arange(offset, offset + len(latitudes), dtype=np.int64)
+            has_time = ~np.isnat(times)
+            if not has_time.all():
+                count, latitudes, longitudes, elevations, times = (count[has_time], latitudes[has_time], longitudes[has_time],
+                                                                   elevations[has_time], times[has_time])
+            if len(count) == 0:
+                continue
+            yield build_segment_columns(count, latitudes, longitudes, elevations, times,
+                                        transformer, min_x, min_y, map_width, map_height, name)
+    except (ET.ParseError, gpxpy.gpx.GPXException) as e:
+        print(f"Error parsing GPX file {gpx_file}: {e}")
+
+def format_csv_scalar(value):
+    """
+    One csv cell as csv.writer writes it (quoted if needed), for the constant columns.
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow([value])
+    return buffer.getvalue()[:-2]
+
+def write_columns_to_csv(csv_file, columns):
+    """
+    Write a dict of columns (from build_segment_columns) to an open csv text file, column-wise: every column is
+    formatted to strings once (floats with repr, like csv.writer) and the rows are joined with str.join, scalar columns
+    are formatted once and repeated. Columns that are the same array (elevationM and positionZ) are formatted once.
+    The output is byte for byte what csv.writer.writerows would write. Returns the number of rows written.
+
+    Formatting the floats with repr (about 800k values/s per column) keeps this at roughly 150k rows/s on its own.
+    """
+    n = len(columns["count"])
+    values = []
+    formatted = {}
+    for name in FIELDNAMES:
+        column = columns[name]
+        if not isinstance(column, np.ndarray):
+            values.append(itertools.repeat(format_csv_scalar(column), n))
+            continue
+        if id(column) not in formatted:
+            if column.dtype.kind == 'M':
+                cells = np.char.add(np.datetime_as_string(column, unit='s'), 'Z').tolist()
+            elif column.dtype.kind == 'f':
+                cells = list(map(repr, column.tolist()))
+                for i in np.flatnonzero(np.isnan(column)).tolist():
+                    cells[i] = ''  # Empty cell, like a missing elevation in process_gpx_file
+            else:
+                cells = list(map(str, column.tolist()))
+            formatted[id(column)] = cells
+        values.append(formatted[id(column)])
+    if n:
+        csv_file.write('\r\n'.join(map(','.join, zip(*values))) + '\r\n')
+    return n
+
+def create_transformer():
+    """
+    Transformer from WGS84 lat/lon to Web Mercator map coordinates.
+    """
+    crs_wgs84 = CRS("epsg:4326")
+    crs_web_mercator = CRS("epsg:3857")
+    return Transformer.from_crs(crs_wgs84, crs_web_mercator, always_xy=False)
+
+def init_worker():
+    """
+    Process pool initializer, every worker process builds its own transformer once.
+    """
+    global worker_transformer
+    worker_transformer = create_transformer()
+
+def process_gpx_file_in_worker(gpx_file, min_x, min_y, map_width, map_height):
+    """
+    Parse and project one whole file in a worker process, returns the list of its column dicts.
+    """
+    return list(process_gpx_file_vectorized(gpx_file, worker_transformer, min_x, min_y, map_width, map_height))
+
+def first_point_time(gpx_file):
+    """
+    Time of the first track point that has one, None if there is none. Only reads the start of the file.
+    """
+    try:
+        for _, _, _, _, time_text in iter_raw_points(gpx_file):
+            if time_text:
+                return parse_gpx_time(time_text).replace(tzinfo=None)
+    except Exception as e:
+        print(f"Error reading first timestamp of {gpx_file}: {e}")
+    return None
+
+def order_gpx_files(gpx_files, order="filename"):
+    """
+    Deterministic output order of the files: by filename, or by the time of their first point ("time").
+    Files without timestamps go last, ties are broken by filename.
+    """
+    gpx_files = sorted(gpx_files)
+    if order == "time":
+        first_times = {gpx_file: first_point_time(gpx_file) for gpx_file in gpx_files}
+        gpx_files.sort(key=lambda gpx_file: (first_times[gpx_file] is None, first_times[gpx_file] or datetime.min, gpx_file))
+    return gpx_files
+
+def iter_gpx_files_parallel(gpx_files, workers, min_x, min_y, map_width, map_height):
+    """
+    Parse and project the files across a process pool and yield their column dicts in the order of gpx_files.
+    Only a window of 2 x workers files is in flight, so at most that many files are held in memory,
+    and results are handed on as soon as every file before them is done.
+    """
+    window = 2 * workers
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        remaining_files = iter(gpx_files)
+        pending = deque(executor.submit(process_gpx_file_in_worker, gpx_file, min_x, min_y, map_width, map_height)
+                        for gpx_file in itertools.islice(remaining_files, window))
+        while pending:
+            columns_list = pending.popleft().result()
+            next_file = next(remaining_files, None)
+            if next_file is not None:
+                pending.append(executor.submit(process_gpx_file_in_worker, next_file, min_x, min_y, map_width, map_height))
+            yield from columns_list
+
+def main(vectorized=True, workers=1, order="filename", output_format="csv"):
     # Read lat/long boundaries from file
     latlong_file = 'latlong.txt'
     latitudes, longitudes = read_latlong_file(latlong_file)
     min_lat, max_lat, min_lon, max_lon = get_min_max(latitudes, longitudes)
     
     # Initialize transformer for lat/lon to map coordinates
-    crs_wgs84 = CRS("epsg:4326")
-    crs_web_mercator = CRS("epsg:3857")
-    transformer = Transformer.from_crs(crs_wgs84, crs_web_mercator, always_xy=False)
+    transformer = create_transformer()
     
     # Calculate map dimensions
     global map_width, map_height, min_x, min_y
     map_width, min_x, min_y = calculate_distance(min_lat, min_lon, min_lat, max_lon, transformer)
     map_height, _, _ = calculate_distance(min_lat, min_lon, max_lat, min_lon, transformer)
     
-    # Prepare CSV file
-    output_file = 'gpx_data.csv'
+    # Prepare CSV file. With output_format "parquet" or "feather" the batched path writes gpx_data.parquet / gpx_data.feather
+    # instead (see GpxColumnarWriter.py)
+    output_file = 'gpx_data.csv' if not vectorized or output_format == "csv" else f'gpx_data.{output_format}'
+
+    if vectorized:
+        # Batched path: project each segment as arrays and write its columns right away.
+        # With workers > 1 the files are parsed in a process pool, the output order is given by order_gpx_files either way.
+        # Measured on one 909k point file: the projection runs at about 4.5M points/s, but reading the points with
+        # iterparse tops out near 125k points/s and the csv formatting near 150k rows/s, so one file goes at about
+        # 60k points/s to csv and 100k points/s to feather, well short of 1M points/s. Many files scale with workers.
+        gpx_files = order_gpx_files([filename for filename in os.listdir('.') if filename.lower().endswith('.gpx')], order)
+        if workers > 1:
+            all_columns = iter_gpx_files_parallel(gpx_files, workers, min_x, min_y, map_width, map_height)
+        else:
+            all_columns = (columns for filename in gpx_files
+                           for columns in process_gpx_file_vectorized(filename, transformer, min_x, min_y, map_width, map_height))
+
+        start_time = time.perf_counter()
+        total_points = 0
+        if output_format == "csv":
+            with open(output_file, 'w', newline='') as csvfile:
+                csv.writer(csvfile).writerow(FIELDNAMES)
+                for columns in all_columns:
+                    total_points += write_columns_to_csv(csvfile, columns)
+        else:
+            # pyarrow is only needed for the columnar formats
+            from GpxColumnarWriter import GpxColumnarWriter, GPX_PATH_COLUMN_TYPES
+            filenames = [os.path.splitext(os.path.basename(gpx_file))[0] for gpx_file in gpx_files]
+            with GpxColumnarWriter(output_file, GPX_PATH_COLUMN_TYPES, filenames) as writer:
+                for columns in all_columns:
+                    total_points += writer.write_columns(columns)
+        elapsed = time.perf_counter() - start_time
+        points_per_second = total_points / elapsed if elapsed > 0 else 0.0
+        print(f"{total_points} points in {elapsed:.2f} s ({points_per_second:,.0f} points/s)")
+        print(f"Data has been written to {output_file}")
+        return
+
     all_points = []
     
     for filename in os.listdir('.'):
@@ -133,16 +335,12 @@ def main():
             all_points.extend(points)
     
     with open(output_file, 'w', newline='') as csvfile:
-        fieldnames = [
-            "count", "latitude", "longitude", "elevationM", "timestamp",
-            "northing", "easting", "elevationFt", "positionX", "positionY",
-            "positionZ", "xdimM", "ydimM", "filename"
-        ]
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
         writer.writeheader()
         writer.writerows(all_points)
     
     print(f"Data has been written to {output_file}")
 
 if __name__ == "__main__":
+    # For project folders with many GPX files, parse them in parallel, e.g. main(workers=os.cpu_count())
     main()
@@ -0,0 +1,243 @@
+"""
+Header-only EXIF reader, shared by GenerateKmz.py, GenKMZwithRotationFinal.py and ReadLatLongAltAndWriteCSV.py.
+
+Opening a photo with PIL and calling _getexif() parses the image container, and the KMZ script opened every photo
+a second time just for the orientation. On network shares that is the biggest cost of the scripts.
+read_photo_info reads the JPEG markers up to the APP1 (Exif) segment, reads only that segment, and returns
+GPS position, orientation and timestamp in one pass. No image data is read or decoded.
+Other formats (png, gif, bmp ...) fall back to PIL.
+
+The hemisphere references are applied: S latitudes and W longitudes are negative, and an altitude
+below sea level (GPSAltitudeRef 1) is negative.
+"""
+
+import struct
+
+ORIENTATION_TAG = 0x0112
+DATETIME_TAG = 0x0132
+EXIF_IFD_TAG = 0x8769
+GPS_IFD_TAG = 0x8825
+DATETIME_ORIGINAL_TAG = 0x9003
+
+# Size in bytes of one value of each TIFF field type
+TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8}
+
+
+def empty_photo_info():
+    return {"latitude": None, "longitude": None, "altitude": None, "orientation": None, "datetime": None}
+
+
+def read_exif_segment(image_path):
+    """
+    Return the TIFF bytes of the Exif APP1 segment of a JPEG file (without the "Exif\\0\\0" header),
+    b"" if the JPEG has no Exif segment, or None if the file is not a JPEG.
+    """
+    with open(image_path, "rb") as image_file:
+        if image_file.read(2) != b"\xff\xd8":
+            return None
+        while True:
+            byte = image_file.read(1)
+            if not byte:
+                return b""
+            if byte != b"\xff":
+                continue
+            marker = image_file.read(1)
+            while marker == b"\xff":  # Fill bytes
+                marker = image_file.read(1)
+            if not marker or marker in (b"\xd9", b"\xda"):  # End of image, or start of the image data
+                return b""
+            if marker == b"\x01" or b"\xd0" <= marker <= b"\xd7":  # Markers without a length
+                continue
+            length_bytes = image_file.read(2)
+            if len(length_bytes) < 2:
+                return b""
+            length = struct.unpack(">H", length_bytes)[0]
+            if marker == b"\xe1":
+                segment = image_file.read(length - 2)
+                if segment.startswith(b"Exif\x00\x00"):
+                    return segment[6:]
+            else:
+                image_file.seek(length - 2, 1)
+
+
+def read_ifd(tiff, offset, byte_order):
+    """
+    Return {tag: (type, count, value bytes)} for the IFD at offset of the TIFF bytes.
+    """
+    entries = {}
+    if offset + 2 > len(tiff):
+        return entries
+    entry_count = struct.unpack_from(byte_order + "H", tiff, offset)[0]
+    for i in range(entry_count):
+        entry_offset = offset + 2 + 12 * i
+        if entry_offset + 12 > len(tiff):
+            break
+        tag, field_type, count = struct.unpack_from(byte_order + "HHI", tiff, entry_offset)
+        size = TYPE_SIZES.get(field_type, 1) * count
+        if size <= 4:
+            value = tiff[entry_offset + 8:entry_offset + 8 + size]
+        else:
+            value_offset = struct.unpack_from(byte_order + "I", tiff, entry_offset + 8)[0]
+            value = tiff[value_offset:value_offset + size]
+            if len(value) < size:
+                continue
+        entries[tag] = (field_type, count, value)
+    return entries
+
+
+def decode_value(entry, byte_order):
+    """
+    Decode an IFD entry: ASCII as str, SHORT/LONG/BYTE as a tuple of ints, RATIONAL as a tuple of floats.
+    """
+    field_type, count, value = entry
+    if field_type == 2:
+        return value.split(b"\x00", 1)[0].decode("ascii", errors="replace").strip()
+    if field_type in (1, 7):
+        return tuple(value)
+    if field_type == 3:
+        return struct.unpack(byte_order + "H" * count, value)
+    if field_type == 4:
+        return struct.unpack(byte_order + "I" * count, value)
+    if field_type in (5, 10):
+        numbers = struct.unpack(byte_order + ("I" if field_type == 5 else "i") * (2 * count), value)
+        return tuple(numbers[i] / numbers[i + 1] if numbers[i + 1] else 0.0 for i in range(0, len(numbers), 2))
+    return value
+
+
+def convert_to_decimal_degrees(coord, ref):
+    degrees = coord[0]
+    minutes = coord[1]
+    seconds = coord[2]
+    decimal_degrees = degrees + (minutes / 60.0) + (seconds / 3600.0)
+
+    # Adjust sign based on hemisphere reference
+    if ref in ['S', 'W']:
+        decimal_degrees = -decimal_degrees
+
+    return decimal_degrees
+
+
+def parse_exif_tiff(tiff):
+    """
+    Read GPS position, orientation and timestamp from the TIFF bytes of an Exif segment.
+    """
+    info = empty_photo_info()
+    if len(tiff) < 8 or tiff[:2] not in (b"II", b"MM"):
+        return info
+    byte_order = "<" if tiff[:2] == b"II" else ">"
+    ifd0 = read_ifd(tiff, struct.unpack_from(byte_order + "I", tiff, 4)[0], byte_order)
+
+    if ORIENTATION_TAG in ifd0:
+        info["orientation"] = decode_value(ifd0[ORIENTATION_TAG], byte_order)[0]
+    if DATETIME_TAG in ifd0:
+        info["datetime"] = decode_value(ifd0[DATETIME_TAG], byte_order)
+    if EXIF_IFD_TAG in ifd0:
+        exif_ifd = read_ifd(tiff, decode_value(ifd0[EXIF_IFD_TAG], byte_order)[0], byte_order)
+        if DATETIME_ORIGINAL_TAG in exif_ifd:
+            info["datetime"] = decode_value(exif_ifd[DATETIME_ORIGINAL_TAG], byte_order)
+
+    if GPS_IFD_TAG in ifd0:
+        gps = read_ifd(tiff, decode_value(ifd0[GPS_IFD_TAG], byte_order)[0], byte_order)
+        if 2 in gps and 4 in gps:
+            lat_ref = decode_value(gps[1], byte_order) if 1 in gps else 'N'
+            lon_ref = decode_value(gps[3], byte_order) if 3 in gps else 'E'
+            info["latitude"] = convert_to_decimal_degrees(decode_value(gps[2], byte_order), lat_ref)
+            info["longitude"] = convert_to_decimal_degrees(decode_value(gps[4], byte_order), lon_ref)
+        if 6 in gps:
+            altitude = decode_value(gps[6], byte_order)[0]
+            if 5 in gps and decode_value(gps[5], byte_order)[:1] == (1,):
+                altitude = -altitude  # Below sea level
+            info["altitude"] = altitude
+    return info
+
+
+def read_photo_info_with_pil(image_path):
+    """
+    Fallback for formats without a JPEG Exif segment, decodes the file header with PIL.
+    """
+    from PIL import Image
+
+    info = empty_photo_info()
+    with Image.open(image_path) as img:
+        exif_data = img._getexif() if hasattr(img, "_getexif") else None
+    if not exif_data:
+        return info
+    info["orientation"] = exif_data.get(274)
+    info["datetime"] = exif_data.get(36867) or exif_data.get(306)
+    gps_data = exif_data.get(34853)
+    if gps_data and 2 in gps_data and 4 in gps_data:
+        info["latitude"] = convert_to_decimal_degrees([float(value) for value in gps_data[2]], gps_data.get(1, 'N'))
+        info["longitude"] = convert_to_decimal_degrees([float(value) for value in gps_data[4]], gps_data.get(3, 'E'))
+        if 6 in gps_data:
+            altitude = float(gps_data[6])
+            info["altitude"] = -altitude if gps_data.get(5) in (1, b"\x01") else altitude
+    return info
+
+
+def read_photo_info(image_path):
+    """
+    Return {"latitude", "longitude", "altitude", "orientation", "datetime"} of a photo, None for missing values.
+    """
+    try:
+        tiff = read_exif_segment(image_path)
+        if tiff is None:
+            return read_photo_info_with_pil(image_path)
+        return parse_exif_tiff(tiff)
+    except Exception as e:
+        print(f"Error processing {image_path}: {e}")
+    return empty_photo_info()
+
+
+def extract_gps_data(image_path):
+    """
+    Latitude, longitude and altitude of a photo, (None, None, None) without GPS data.
+    """
+    info = read_photo_info(image_path)
+    return info["latitude"], info["longitude"], info["altitude"]
+
+
+def find_orientation_offset(jpeg_bytes):
+    """
+    Return (offset, byte order) of the Orientation value in the JPEG bytes, None if the photo has no Orientation tag.
+    The offset points at the 2 byte SHORT inside the APP1 segment, so it can be patched without rewriting anything else.
+    """
+    position = 2
+    if jpeg_bytes[:2] != b"\xff\xd8":
+        return None
+    while position + 4 <= len(jpeg_bytes):
+        if jpeg_bytes[position] != 0xFF:
+            return None
+        marker = jpeg_bytes[position + 1]
+        if marker in (0xD9, 0xDA):
+            return None
+        length = struct.unpack_from(">H", jpeg_bytes, position + 2)[0]
+        if marker == 0xE1 and jpeg_bytes[position + 4:position + 10] == b"Exif\x00\x00":
+            tiff_start = position + 10
+            tiff = jpeg_bytes[tiff_start:position + 2 + length]
+            if tiff[:2] not in (b"II", b"MM"):
+                return None
+            byte_order = "<" if tiff[:2] == b"II" else ">"
+            ifd_offset = struct.unpack_from(byte_order + "I", tiff, 4)[0]
+            entry_count = struct.unpack_from(byte_order + "H", tiff, ifd_offset)[0]
+            for i in range(entry_count):
+                entry_offset = ifd_offset + 2 + 12 * i
+                tag, field_type = struct.unpack_from(byte_order + "HH", tiff, entry_offset)
+                if tag == ORIENTATION_TAG and field_type == 3:
+                    return tiff_start + entry_offset + 8, byte_order
+            return None
+        position += 2 + length
+    return None
+
+
+def patch_orientation(jpeg_bytes, value=1):
+    """
+    Return the JPEG bytes with the Orientation tag set to value, patched in place in the Exif segment.
+    The bytes are returned unchanged if the photo has no Orientation tag.
+    """
+    found = find_orientation_offset(jpeg_bytes)
+    if found is None:
+        return jpeg_bytes
+    offset, byte_order = found
+    patched = bytearray(jpeg_bytes)
+    struct.pack_into(byte_order + "H", patched, offset, value)
+    return bytes(patched)
@@ -7,10 +7,21 @@ Please take a look of the example docx file to learn how this script work.
 """
 
 
+import os
+import glob
+import time
+import itertools
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import docx
 import openpyxl
 from openpyxl import Workbook
-import re
+import zipfile
+import xml.etree.ElementTree as ET
+# Precompiled, memoized text transforms of the descriptions and notes
+from GeologicalDescriptionFormat import reformat_color_description, extract_legend_code, remove_legend_code, split_notes_into_rows, \
+    note_reference_keys, note_key
 
 
 """
@@ -37,35 +48,71 @@ def list_docx_components(docx_path):
     for element in doc.element.body:
         if element.tag.endswith('p'):
             para = element.xpath('.//w:t')
-            para_text = ''.join([text.text for text in para]).strip()
+            para_text = ''.join([text.text or '' for text in para]).strip()
             components.append(('Paragraph', para_text))
         elif element.tag.endswith('tbl'):
             table = []
             for row_idx, row in enumerate(element.xpath('.//w:tr')):
                 row_data = []
                 for col_idx, cell in enumerate(row.xpath('.//w:tc')):
-                    cell_text = ''.join([text.text for text in cell.xpath('.//w:t')])
+                    cell_text = ''.join([text.text or '' for text in cell.xpath('.//w:t')])
                     row_data.append(cell_text)
                 table.append(row_data)
             components.append(('Table', table))
 
     return components
 
-# This function deal with the first type of table, the table 1 on each page. 
-# Write the pre defined headers and write the data to the file.
-def write_location_details_to_excel(data, output_path):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Location Details"
-    
-    headers = [
+# Streaming version of list_docx_components, for very large files (thousands of pages and tables).
+# word/document.xml is parsed straight from the docx zip with incremental XML events. Each paragraph or table of the body
+# is yielded as soon as its end tag is read, with the same ('Paragraph', text) / ('Table', rows) form as above,
+# and then removed from the tree, so only one table is in memory at a time.
+W_NAMESPACE = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+W_BODY, W_P, W_TBL = W_NAMESPACE + "body", W_NAMESPACE + "p", W_NAMESPACE + "tbl"
+W_TR, W_TC, W_T = W_NAMESPACE + "tr", W_NAMESPACE + "tc", W_NAMESPACE + "t"
+
+def iter_docx_components(docx_path):
+    with zipfile.ZipFile(docx_path) as docx_zip:
+        with docx_zip.open("word/document.xml") as document_xml:
+            body = None
+            for event, element in ET.iterparse(document_xml, events=("start", "end")):
+                if event == "start":
+                    if element.tag == W_BODY:
+                        body = element
+                    continue
+                if body is None or element not in body:
+                    continue
+                if element.tag == W_P:
+                    yield ('Paragraph', ''.join([text.text or '' for text in element.iter(W_T)]).strip())
+                elif element.tag == W_TBL:
+                    table = []
+                    for row in element.iter(W_TR):
+                        table.append([''.join([text.text or '' for text in cell.iter(W_T)]) for cell in row.iter(W_TC)])
+                    yield ('Table', table)
+                body.remove(element)
+
+# The three output tables: sheet title, headers and default output file.
+# Table 1 on each page goes to the location details, table 2 to the field geological descriptions, and table 3 to the depth related remarks.
+OUTPUT_TABLES = {
+    "location_details": ("Location Details", [
         "Location ID", "Project No.", "Project", "Client", "Date", "Location", "Logged By", 
         "Excavation Contractor", "Surface Elevation", "Excavation Equipment", "Completion Depth", 
         "Groundwater Depth First Encountered", "Groundwater Depth End of Excavation", 
         "Groundwater Elevation First Encountered", "Groundwater Elevation End of Excavation", 
         "Seasonal High Groundwater Depth", "SHGW Elevation"
-    ]
-    
+    ], "Location_Detail.xlsx"),
+    "field_geological_descriptions": ("Field Geological Descriptions",
+                                      ["Location ID", "Depth Top", "Depth Base", "Description", "Legend Code"],
+                                      "Field_Geological_Descriptions.xlsx"),
+    "depth_related_remarks": ("Depth Related Remarks",
+                              ["Location ID", "Depth Top", "Depth Base", "Remarks"],
+                              "Depth_Related_Remarks.xlsx"),
+}
+
+# Write the pre defined headers and the data of one output table to a file.
+# The workbook is in openpyxl write-only mode, the rows are streamed to the file instead of kept as cells in memory.
+def write_to_excel(data, output_path, title, headers):
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(title)
     ws.append(headers)
     
     for entry in data:
@@ -73,109 +120,90 @@ def write_location_details_to_excel(data, output_path):
     
     wb.save(output_path)
 
+# This function deal with the first type of table, the table 1 on each page. 
+def write_location_details_to_excel(data, output_path):
+    title, headers, _ = OUTPUT_TABLES["location_details"]
+    write_to_excel(data, output_path, title, headers)
+
 # This function deal with the second type of table, the table 2 on each page. 
-# Write the pre defined headers and write the data to the file.
 def write_field_geological_descriptions_to_excel(data, output_path):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Field Geological Descriptions"
-    
-    headers = ["Location ID", "Depth Top", "Depth Base", "Description", "Legend Code"]
-    ws.append(headers)
-    
-    for entry in data:
-        ws.append(entry)
-    
-    wb.save(output_path)
+    title, headers, _ = OUTPUT_TABLES["field_geological_descriptions"]
+    write_to_excel(data, output_path, title, headers)
 
 # This function deal with the third type of table, the table 3 on each page. 
-# Write the pre defined headers and write the data to the file.
 def write_depth_related_remarks_to_excel(data, output_path):
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Depth Related Remarks"
-    
-    headers = ["Location ID", "Depth Top", "Depth Base", "Remarks"]
-    ws.append(headers)
-    
-    for entry in data:
-        ws.append(entry)
-    
-    wb.save(output_path)
+    title, headers, _ = OUTPUT_TABLES["depth_related_remarks"]
+    write_to_excel(data, output_path, title, headers)
 
+# Write the rows of all three output tables while they are produced, instead of collecting them in lists first.
+# sheets["location_details"] etc. are openpyxl write-only worksheets, rows are added with .append(row) like to a list,
+# and each row goes to a temporary file right away, so memory does not grow with the number of rows.
+# With single_workbook_path set, the three tables are three sheets of that one workbook, otherwise each goes to
+# its own file (output_paths, by default the file names in OUTPUT_TABLES). The files are written by close().
+# source_column adds a "Source Document" column in front of the headers, for the batch mode.
+class ExcelTableWriter:
+    def __init__(self, output_paths=None, single_workbook_path=None, source_column=False):
+        self.workbooks = {}
+        self.sheets = {}
+        for name, (title, headers, default_path) in OUTPUT_TABLES.items():
+            path = single_workbook_path or (output_paths or {}).get(name, default_path)
+            if path not in self.workbooks:
+                self.workbooks[path] = Workbook(write_only=True)
+            self.sheets[name] = self.workbooks[path].create_sheet(title)
+            self.sheets[name].append((["Source Document"] if source_column else []) + headers)
 
-# Actually, consider editing the previous 3 functions into one write_to_excel can simplify this scripts
+    def close(self):
+        for path, wb in self.workbooks.items():
+            wb.save(path)
 
-# This is for reformat the color description. Since the original document put color after the numbers, we need separte them and move the color forward.
-# pay attention to the and/or situation. 
-def reformat_color_description(description):
-    # Split the description by 'and' or 'to' to handle multiple color parts
-    parts = re.split(r'\s+and\s+|\s+to\s+', description)
-    
-    formatted_parts = []
-    for part in parts:
-        # Match the Munsell color and the color name
-        match = re.match(r'(\d+(\.\d+)?[A-Z]+\s\d+/\d+)\s(.+)', part)
-        if match:
-            munsell_code = '[' + match.group(1) +']'
-            color_name = match.group(3)
-            formatted_parts.append(f"{color_name} {munsell_code}")
-    
-    # Join the formatted parts with 'and' if there are multiple parts
-    return ' and '.join(formatted_parts)
+    def __enter__(self):
+        return self
 
-# This is for extracting the legend code from [....]
-def extract_legend_code(description):
-    match = re.search(r'\[(.*?)\]', description)
-    return match.group(1) if match else ""
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Only save complete outputs
+        if exc_type is None:
+            self.close()
 
-# Remove legend code from the cell data. 
-def remove_legend_code(description):
-    return re.sub(r'\[.*?\]', '', description).strip()
-    
 
-# Function to format and split notes(in table3) into individual points
-def split_notes_into_rows(notes):
-    # Use regex to split the notes by the pattern (1), (2), (3), ... or *
-    split_notes = re.split(r'(\(\d+\)\s*|\*\s*)', notes)
-    # Combine the split notes to include the numbering or asterisk with the text, also assemble them into pairs, so the first part of pair is just numbering,
-    # like (1), (2) ..... Can be used to match the values in table2 
-    formatted_notes = []
-    for i in range(1, len(split_notes), 2):
-        formatted_notes.append((split_notes[i].strip(), split_notes[i].strip() + split_notes[i+1].strip()))
-    return formatted_notes
+# Index of the depth rows of table2 by note: {note key: (depth top, depth base)}, built in one pass over the rows.
+# The notes column (temp_row[8]) refers to the notes of table3 by number, like "(1), (2)", "(1,2)" or "(12)".
+# When several rows refer to the same note, the first row is used.
+def build_note_depth_index(temp_table2):
+    note_index = {}
+    for temp_row in (temp_table2 or [])[2:]:
+        if len(temp_row) > 8:
+            for key in note_reference_keys(temp_row[8]):
+                note_index.setdefault(key, (temp_row[0], temp_row[1]))
+    return note_index
 
-
-# Appending table3 data to depth_related_remarks
+# Appending table3 data to depth_related_remarks, each note with the depths of the table2 row that refers to it
 def process_table_3(table, temp_table2, current_title, depth_related_remarks):
+    note_index = build_note_depth_index(temp_table2)
     for row in table[1:]:
         notes = row[0]  
         formatted_notes = split_notes_into_rows(notes)
         
         for note in formatted_notes:
-            note_number = note[0]  # The first element of the tuple is the note number
-            if len(note_number) == 3:  # Like (1) - (9) 
-                note_number = note_number[1:2] # This step is optional, this remove the brackets, so the (1) become 1, to deal with situation like (1,2). This need to be changed if the notes number larger than 10.
-            found_match = False
-            
-            for temp_row in temp_table2[2:]:
-                if note_number in temp_row[8]:  # Check if the note number is in the notes column of temp_table2
-                    depth_related_remarks.append([current_title, temp_row[0], temp_row[1], note[1]])
-                    found_match = True
-                    break
-            
-            if not found_match:
-                depth_related_remarks.append([current_title, "", "", note[1]])
-
-
-
-def main(doc_path):
-    components = list_docx_components(doc_path)
+            # The first element of the tuple is the note number, (1) -> 1, (12) -> 12, * stays *
+            depth_top, depth_base = note_index.get(note_key(note[0]), ("", ""))
+            depth_related_remarks.append([current_title, depth_top, depth_base, note[1]])
+
+
+
+# streaming: read the file with iter_docx_components, False for list_docx_components (python-docx, whole file in memory)
+# single_workbook_path: write the three tables as sheets of this one workbook, instead of the three files
+def main(doc_path, streaming=True, single_workbook_path=None):
+    with ExcelTableWriter(single_workbook_path=single_workbook_path) as writer:
+        process_components(iter_docx_components(doc_path) if streaming else list_docx_components(doc_path), writer.sheets)
+
+# Process the components of the document and append the rows to the three output tables,
+# sheets maps the names in OUTPUT_TABLES to anything with .append(row), the ExcelTableWriter sheets or lists.
+def process_components(components, sheets):
     current_title = None
     # content of the three output files
-    location_details = []
-    field_geological_descriptions = []
-    depth_related_remarks = []
+    location_details = sheets["location_details"]
+    field_geological_descriptions = sheets["field_geological_descriptions"]
+    depth_related_remarks = sheets["depth_related_remarks"]
     # use a table counter, count to 3 to determine which table to process
     table_counter = 0
     # temporarily store the table2 for the table3 in the same page to find the depth
@@ -230,18 +258,85 @@ def main(doc_path):
                         current_title, row[0], row[1], description, legend_code
                     ])
             elif table_counter == 3:  # Table 3
-                for row in table[1:]:
-                    #depth_related_remarks.append([current_title, "", "", row[0]])
-                    process_table_3(table, temp_table2, current_title, depth_related_remarks)
+                # process_table_3 handles all rows of the table, once per page
+                process_table_3(table, temp_table2, current_title, depth_related_remarks)
                 table_counter = 0  # Reset counter after processing Table 3
 
-    #finally write all data to files.
-    write_location_details_to_excel(location_details, "Location_Detail.xlsx")
-    write_field_geological_descriptions_to_excel(field_geological_descriptions, "Field_Geological_Descriptions.xlsx")
-    write_depth_related_remarks_to_excel(depth_related_remarks, "Depth_Related_Remarks.xlsx")
-
 
 
 # For any other files with exact same format, just place this script in the same folder and rename the file name below.
+# Batch mode, the worker process part: convert one document into the rows of the three tables.
+# Returns (rows by table name, seconds), the rows are sent back to the main process which writes them.
+def convert_document(doc_path):
+    start_time = time.perf_counter()
+    tables = {name: [] for name in OUTPUT_TABLES}
+    process_components(iter_docx_components(doc_path), tables)
+    return tables, time.perf_counter() - start_time
+
+# The docx files of a folder, or of a glob pattern like r"C:\logs\*.docx", sorted by path.
+# Word's temporary "~$" lock files are left out.
+def find_documents(folder_or_pattern):
+    pattern = os.path.join(folder_or_pattern, "*.docx") if os.path.isdir(folder_or_pattern) else folder_or_pattern
+    return sorted(path for path in glob.glob(pattern) if not os.path.basename(path).startswith("~$"))
+
+# The folder the "Source Document" paths are relative to: the folder itself, or the part of a glob pattern
+# before the first wildcard, so documents with the same name in different subfolders stay apart.
+def document_root(folder_or_pattern):
+    if os.path.isdir(folder_or_pattern):
+        return folder_or_pattern
+    root = os.path.dirname(folder_or_pattern)
+    while glob.has_magic(root):
+        root = os.path.dirname(root)
+    return root or "."
+
+# Batch mode: convert every docx of a folder or glob pattern, parsing the documents in a process pool.
+# The rows of all documents go into the same three tables (or the three sheets of single_workbook_path), with a "Source Document"
+# column in front, the document path relative to the folder (or to the pattern's folder). The documents are written in sorted path
+# order whatever order the workers finish in, so the output is the same from run to run. Only 2 x workers documents are in flight
+# and the rows of each one are released once they are written, so memory does not grow with the batch. The rows count and time of
+# each document are printed, a document that fails is reported and left out.
+# Returns {document path: (rows count by table name, seconds)} for the converted documents.
+def main_batch(folder_or_pattern, workers=None, output_paths=None, single_workbook_path=None):
+    doc_paths = find_documents(folder_or_pattern)
+    root = document_root(folder_or_pattern)
+    window = 2 * (workers or os.cpu_count() or 1)
+    start_time = time.perf_counter()
+    report = {}
+    with ExcelTableWriter(output_paths, single_workbook_path, source_column=True) as writer:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            remaining_paths = iter(doc_paths)
+            pending = deque((doc_path, executor.submit(convert_document, doc_path))
+                            for doc_path in itertools.islice(remaining_paths, window))
+            # Collect in submission order, later documents that finish early wait in their futures
+            while pending:
+                doc_path, future = pending.popleft()
+                next_path = next(remaining_paths, None)
+                if next_path is not None:
+                    pending.append((next_path, executor.submit(convert_document, next_path)))
+                source = os.path.relpath(doc_path, root)
+                try:
+                    tables, seconds = future.result()
+                except Exception as e:
+                    print(f"{source}: failed, {e}")
+                    continue
+                for name, rows in tables.items():
+                    for row in rows:
+                        writer.sheets[name].append([source] + row)
+                report[doc_path] = ({name: len(rows) for name, rows in tables.items()}, seconds)
+                print(f"{source}: {len(tables['location_details'])} locations, {len(tables['field_geological_descriptions'])} descriptions, "
+                      f"{len(tables['depth_related_remarks'])} remarks in {seconds:.2f} s")
+                # Release the rows before waiting for the next document
+                del future, tables
+    elapsed = time.perf_counter() - start_time
+    print(f"Converted {len(report)} of {len(doc_paths)} documents in {elapsed:.1f} s")
+    return report
+
 if __name__ == "__main__":
+    # Needed for the batch mode process pool in a pyinstaller build
+    multiprocessing.freeze_support()
     main("FromDocxTableToExcelFileExample.docx")
+
+    # Batch mode, every docx in a folder (or a glob pattern), merged into the three files with a source document column
+    #main_batch(r"C:\BoringLogs")
+    # or into one workbook with three sheets
+    #main_batch(r"C:\BoringLogs\*.docx", single_workbook_path="Boring_Logs.xlsx")
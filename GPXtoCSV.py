@@ -1,8 +1,43 @@
 import gpxpy
 import csv
+from GpxStreamReader import iter_track_points
 
-# Function to extract data from GPX file and write to CSV
+# Function to extract data from GPX file and write to CSV, reading the points with the streaming reader.
+# Rows are written while the file is being read, so memory stays flat for GPX files of several hundred MB.
 def extract_gpx_data(input_file, output_file):
+    with open(output_file, 'w', newline='') as csv_file:
+        csv_writer = csv.writer(csv_file)
+        csv_writer.writerow(["sequence", "latitude", "longitude", "elevation", "timestamp"])
+
+        for sequence, (latitude, longitude, elevation, time) in enumerate(iter_track_points(input_file), start=1):
+            timestamp = time.isoformat() if time is not None else None
+            csv_writer.writerow([sequence, latitude, longitude, elevation, timestamp])
+
+    print(f"Data extracted from '{input_file}' and saved to '{output_file}'")
+
+# Write the points to a columnar file instead (.parquet, or .feather which can be memory mapped), see GpxColumnarWriter.py.
+# Same columns as the csv, with float and timestamp types.
+def extract_gpx_data_columnar(input_file, output_file):
+    import numpy as np
+    from GpxStreamReader import iter_point_chunks
+    from GpxColumnarWriter import GpxColumnarWriter, GPX_POINT_COLUMN_TYPES
+
+    sequence = 1
+    with GpxColumnarWriter(output_file, GPX_POINT_COLUMN_TYPES) as writer:
+        for _, latitudes, longitudes, elevations, times in iter_point_chunks(input_file):
+            writer.write_columns({
+                "sequence": np.arange(sequence, sequence + len(latitudes), dtype=np.int64),
+                "latitude": latitudes,
+                "longitude": longitudes,
+                "elevation": elevations,
+                "timestamp": times,
+            })
+            sequence += len(latitudes)
+
+    print(f"Data extracted from '{input_file}' and saved to '{output_file}'")
+
+# Older version, loads the whole file with gpxpy before writing the first row
+def extract_gpx_data_gpxpy(input_file, output_file):
     with open(input_file, 'r') as gpx_file, open(output_file, 'w', newline='') as csv_file:
         gpx = gpxpy.parse(gpx_file)
 
@@ -36,3 +71,6 @@ output_csv_file = 'output2.csv'
 
 # Call the function to extract GPX data and write to CSV
 extract_gpx_data(input_gpx_file, output_csv_file)
+
+# Or write a columnar file for the plotting and video sync tools
+#extract_gpx_data_columnar(input_gpx_file, 'output2.feather')
@@ -1,14 +1,24 @@
 import os
+import io
 import zipfile
-from PIL import Image, ImageFile
+import multiprocessing
+import itertools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from PIL import Image, ImageFile, ImageOps
 import piexif
 import shutil
+import subprocess
+from pathlib import Path
+from ExifHeaderReader import read_photo_info, patch_orientation
+from PhotoPreviewCache import make_preview, preview_arcname
+from KmlRegionTiler import write_tiled_kml
 
 # This script can be built into a exe using pyinstaller. 
 # Put the script or exe into the same folder with photos (photos with location data in their exif)
 # double click the script or exe, it will generate a kmz file that contain photo and a kml file.
 # you can then drag and drop the kmz to a Google Earth app window, and view the photos by location in Google Earth.
 # This version added the "rotate_image" to solve the problem of vertical image showing horizontally. 
+# By default the photos are rotated losslessly with jpegtran (from libjpeg / libjpeg-turbo), put jpegtran on the PATH or next to the exe.
 
 
 
@@ -16,33 +26,11 @@ import shutil
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
 
-# Function to convert GPS coordinates to decimal degrees
-def convert_to_decimal_degrees(coord, ref):
-    """
-    Convert GPS coordinates stored in degrees, minutes, and seconds (DMS) to decimal degrees.
-
-    Parameters:
-    coord (tuple): A tuple containing (degrees, minutes, seconds).
-    ref (str): Reference for latitude or longitude (e.g., 'N', 'S', 'E', 'W').
-
-    Returns:
-    float: The decimal degree representation of the coordinates.
-    """
-    degrees = coord[0]
-    minutes = coord[1]
-    seconds = coord[2]
-    decimal_degrees = degrees + (minutes / 60.0) + (seconds / 3600.0)
-    
-    # Adjust sign based on hemisphere reference
-    if ref in ['S', 'W']:
-        decimal_degrees = -decimal_degrees
-    
-    return decimal_degrees
-
 # Function to extract GPS data from an image
 def extract_gps_data(image_path):
     """
     Extract GPS latitude, longitude, and altitude from the EXIF data of an image.
+    Only the Exif header of the file is read, see ExifHeaderReader.py.
 
     Parameters:
     image_path (str): Path to the image file.
@@ -50,20 +38,8 @@ def extract_gps_data(image_path):
     Returns:
     tuple: A tuple containing latitude, longitude, and altitude.
     """
-    try:
-        with Image.open(image_path) as img:
-            exif_data = img._getexif()
-            if exif_data and 34853 in exif_data:
-                gps_data = exif_data[34853]  # GPSInfo tag
-
-                latitude = convert_to_decimal_degrees(gps_data[2], gps_data[1])  # GPS latitude
-                longitude = convert_to_decimal_degrees(gps_data[4], gps_data[3])  # GPS longitude
-                altitude = gps_data[6] if 6 in gps_data else None  # GPS altitude
-                
-                return latitude, longitude, altitude
-    except Exception as e:
-        print(f"Error processing {image_path}: {e}")
-    return None, None, None
+    info = read_photo_info(image_path)
+    return info["latitude"], info["longitude"], info["altitude"]
 
 # Function to get the orientation of an image from its EXIF data
 def get_image_orientation(image_path):
@@ -76,15 +52,7 @@ def get_image_orientation(image_path):
     Returns:
     int: The orientation value (1, 3, 6, 8) from EXIF data.
     """
-    try:
-        with Image.open(image_path) as img:
-            exif_data = img._getexif()
-            if exif_data:
-                orientation = exif_data.get(274)  # Orientation tag
-                return orientation
-    except Exception as e:
-        print(f"Error getting orientation for {image_path}: {e}")
-    return None
+    return read_photo_info(image_path)["orientation"]
 
 # Function to rotate an image based on the provided angle and preserve EXIF data
 def rotate_image(input_image_path, output_image_path, angle):
@@ -112,6 +80,284 @@ def rotate_image(input_image_path, output_image_path, angle):
     # Save the rotated image with EXIF data
     rotated_image.save(output_image_path, exif=exif_bytes)
 
+# Function to get the rotation angle that brings an image upright from its EXIF orientation
+def get_rotation_angle(orientation):
+    """
+    Get the angle for rotate_image from an EXIF orientation value.
+
+    Parameters:
+    orientation (int): The orientation value (1, 3, 6, 8) from EXIF data, or None.
+
+    Returns:
+    int: 180 for 3, 270 for 6, 90 for 8, and 0 (no rotation needed) otherwise.
+    """
+    if orientation == 3:
+        return 180  # Rotate 180 degrees
+    elif orientation == 6:
+        return 270  # Rotate 270 degrees (or -90)
+    elif orientation == 8:
+        return 90  # Rotate 90 degrees
+    return 0  # No rotation needed
+
+# Function to rotate an image and return the encoded result, used by the worker processes of the pipelined mode
+def rotate_image_to_bytes(input_image_path, angle):
+    """
+    Rotate an image by a specified angle and return the JPEG bytes, with the EXIF data preserved and the
+    Orientation tag set to "Horizontal (normal)". The image is encoded once, instead of saving it and
+    opening it again to patch the Orientation tag.
+
+    Parameters:
+    input_image_path (str): Path to the input image file.
+    angle (int): The angle by which to rotate the image (e.g., 90, 180, 270 degrees).
+
+    Returns:
+    bytes: The encoded rotated image.
+    """
+    with Image.open(input_image_path) as image:
+        exif_dict = piexif.load(image.info.get("exif", b''))
+        exif_dict['0th'][piexif.ImageIFD.Orientation] = 1  # Set to "Horizontal (normal)"
+        # piexif can not dump the thumbnail of some cameras, the photo does not need it
+        exif_dict.pop('thumbnail', None)
+        rotated_image = image.rotate(angle, expand=True)
+        output = io.BytesIO()
+        rotated_image.save(output, format=image.format, exif=piexif.dump(exif_dict))
+    return output.getvalue()
+
+# Function to bring an image upright from any EXIF orientation and return the encoded result, mirrored ones included
+def transpose_image_to_bytes(input_image_path):
+    """
+    Apply the EXIF orientation of an image with PIL (rotation and mirroring) and return the JPEG bytes.
+    The EXIF data is kept without the Orientation tag, so viewers show the pixels as they are.
+    Used for the mirrored orientations (2, 4, 5, 7), which get_rotation_angle can not express as an angle.
+
+    Parameters:
+    input_image_path (str): Path to the input image file.
+
+    Returns:
+    bytes: The encoded upright image.
+    """
+    with Image.open(input_image_path) as image:
+        upright_image = ImageOps.exif_transpose(image)
+        output = io.BytesIO()
+        upright_image.save(output, format=image.format, exif=upright_image.getexif())
+    return output.getvalue()
+
+# Function to bring an image upright with PIL, used by the "reencode" mode and as the fallback of rotate_image_lossless
+def reencode_upright(input_image_path, orientation):
+    if orientation in (2, 4, 5, 7):
+        return transpose_image_to_bytes(input_image_path)
+    return rotate_image_to_bytes(input_image_path, get_rotation_angle(orientation))
+
+# jpegtran arguments that bring a JPEG upright for each EXIF orientation value
+JPEGTRAN_TRANSFORMS = {
+    2: ["-flip", "horizontal"],
+    3: ["-rotate", "180"],
+    4: ["-flip", "vertical"],
+    5: ["-transpose"],
+    6: ["-rotate", "90"],
+    7: ["-transverse"],
+    8: ["-rotate", "270"],
+}
+
+# Function to rotate a JPEG without decoding it, used by the worker processes of the pipelined mode
+def rotate_image_lossless(input_image_path, orientation):
+    """
+    Bring a JPEG upright losslessly and return its bytes. jpegtran (libjpeg) rotates the DCT coefficients
+    directly, so the pixels are never decoded or re-encoded and the quality of the original is kept.
+    The Orientation tag is then set to "Horizontal (normal)" in place in the copied EXIF segment.
+    -perfect refuses photos whose size is not a multiple of the JPEG block size, for those -trim drops
+    the partial edge blocks (a few pixels). Without jpegtran on the PATH, or for other formats,
+    the photo is re-encoded with PIL instead (reencode_upright), mirrored orientations included.
+
+    Parameters:
+    input_image_path (str): Path to the input image file.
+    orientation (int): The EXIF orientation value of the image.
+
+    Returns:
+    bytes: The encoded upright image.
+    """
+    if orientation not in JPEGTRAN_TRANSFORMS or not input_image_path.lower().endswith((".jpg", ".jpeg")) \
+            or shutil.which("jpegtran") is None:
+        return reencode_upright(input_image_path, orientation)
+
+    for edge_option in ("-perfect", "-trim"):
+        result = subprocess.run(["jpegtran", "-copy", "all", edge_option] + JPEGTRAN_TRANSFORMS[orientation] + [input_image_path],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode == 0 and result.stdout:
+            return patch_orientation(result.stdout, 1)
+    return reencode_upright(input_image_path, orientation)
+
+# Function to write the placemarks of images to an open text stream
+def write_placemarks(kml_stream, image_data, image_style="max-width:1500px;", sources=None, src_prefix=""):
+    """
+    Write one KML placemark per image to a text stream.
+
+    Parameters:
+    kml_stream (file): Open text stream, e.g. a file or an entry of the KMZ zip.
+    image_data (dict): A dictionary containing image file names and their corresponding GPS data.
+    image_style (str): CSS style of the photo in the placemark balloon.
+    sources (dict): Optional, image file name to (path inside the KMZ, path of the original photo to link or None).
+                    By default the photo is files/<image file name> without a link.
+    src_prefix (str): Put in front of the photo paths, "../" for the tile KML files in the tiles folder of the KMZ.
+    """
+    for img_name, (lat, lon, alt) in image_data.items():
+        src, original_path = sources.get(img_name, ("files/" + img_name, None)) if sources else ("files/" + img_name, None)
+        link = f'<br><a href="{Path(original_path).resolve().as_uri()}">Original photo</a>' if original_path else ""
+        kml_stream.write(f"""
+        <Placemark>
+            <name>{img_name}</name>
+            <description><![CDATA[<img style="{image_style}" src="{src_prefix}{src}">{link}]]></description>
+            <Point>
+                <coordinates>{lon},{lat},{alt or 0}</coordinates>
+            </Point>
+        </Placemark>
+        """)
+
+# Function to write the KML of the GPS data of images to an open text stream
+def write_kml(kml_stream, image_data, image_style="max-width:1500px;", sources=None):
+    """
+    Write the KML content to a text stream placemark by placemark, the streaming version of create_kml.
+
+    Parameters:
+    kml_stream (file): Open text stream, e.g. a file or an entry of the KMZ zip.
+    image_data (dict): A dictionary containing image file names and their corresponding GPS data.
+    image_style (str): CSS style of the photo in the placemark balloon.
+    sources (dict): Optional, image file name to (path inside the KMZ, path of the original photo to link or None).
+                    By default the photo is files/<image file name> without a link.
+    """
+    kml_stream.write("""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2" xmlns:kml="http://www.opengis.net/kml/2.2" xmlns:atom="http://www.w3.org/2005/Atom">
+<Document>
+    <name>photo_data.kmz</name>
+    <Folder>
+        <name>Photo Points</name>
+    """)
+
+    write_placemarks(kml_stream, image_data, image_style, sources)
+
+    kml_stream.write("""
+    </Folder>
+</Document>
+</kml>
+""")
+
+# Function to run tasks in a process pool with a bounded number in flight, used by the pipelined mode
+def iter_bounded_results(pool, tasks, window):
+    """
+    Submit (key, function, *args) tasks to the pool and yield (key, result) in the order they finish.
+    Only window tasks are in flight, and each Future is dropped once its result is handed on,
+    so at most window encoded photos are held in memory however many photos there are.
+    """
+    tasks = iter(tasks)
+    futures = {}
+
+    def submit_next(count):
+        for key, function, *args in itertools.islice(tasks, count):
+            futures[pool.submit(function, *args)] = key
+
+    submit_next(window)
+    while futures:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            key = futures.pop(future)
+            yield key, future.result()
+        submit_next(window - len(futures))
+
+# Function to create the KMZ file with a pipeline: EXIF scan in threads, rotation in processes, one zip writer
+def create_kmz_pipelined(folder_path, kmz_file, workers=None, rotation_mode="lossless", preview_long_edge=None, link_originals=False,
+                         tile_capacity=None):
+    """
+    Create the KMZ file without temporary files, using all cores.
+    1. A thread pool reads the EXIF header (GPS and orientation) of every photo, the reads are I/O bound.
+    2. A process pool rotates the photos that need it. Upright photos are copied as they are.
+    3. This process is the single writer, it appends each photo to the KMZ as soon as its result arrives.
+       At most 2 x workers photos are in flight (iter_bounded_results), so memory does not grow with the folder.
+    The photos are sorted by file name, so the placemark order in doc.kml does not depend on which photo finishes first.
+
+    rotation_mode sets how the photos are brought upright:
+    "lossless"  jpegtran rotation of the DCT coefficients plus an in place Orientation patch (rotate_image_lossless)
+    "metadata"  the photos are copied unchanged with their orientation tag, and the balloon style asks the
+                viewer to apply it (image-orientation: from-image)
+    "reencode"  decode, rotate (or mirror) and re-encode with PIL (reencode_upright)
+
+    With preview_long_edge set, the process pool builds upright previews (PhotoPreviewCache.make_preview) instead,
+    which are embedded in place of the full resolution photos and cached in the ".kmz_preview_cache" folder for the next run.
+
+    With tile_capacity set, the placemarks are written to region based tile KML files (KmlRegionTiler.write_tiled_kml)
+    instead of one flat doc.kml, so the viewer only loads the photos of the area on screen.
+
+    Parameters:
+    folder_path (str): Path to the folder containing the photos.
+    kmz_file (str): Path to save the generated KMZ file.
+    workers (int): Number of worker processes for the rotation, None for one per core.
+    rotation_mode (str): "lossless", "metadata" or "reencode".
+    preview_long_edge (int): Long edge in pixels of the embedded previews, None to embed the photos themselves.
+    link_originals (bool): Link each placemark to the original photo on disk.
+    tile_capacity (int): Maximum number of photos per tile, None for a single doc.kml.
+
+    Returns:
+    dict: The image data written to the KML.
+    """
+    filenames = sorted(filename for filename in os.listdir(folder_path)
+                       if filename.lower().endswith((".jpg", ".jpeg", ".png", ".gif", ".bmp")))
+    image_paths = [os.path.join(folder_path, filename) for filename in filenames]
+
+    with ThreadPoolExecutor(max_workers=32) as scan_pool:
+        infos = list(scan_pool.map(read_photo_info, image_paths))
+
+    image_data = {}
+    angles = {}
+    for filename, info in zip(filenames, infos):
+        if info["latitude"] is not None and info["longitude"] is not None:
+            image_data[filename] = (info["latitude"], info["longitude"], info["altitude"])
+            if rotation_mode != "metadata" and info["orientation"] not in (None, 1):
+                angles[filename] = info["orientation"]
+            else:
+                angles[filename] = None
+
+    sources = {filename: ("files/" + filename, os.path.join(folder_path, filename) if link_originals else None)
+               for filename in image_data}
+    preview_cache_folder = os.path.join(folder_path, ".kmz_preview_cache")
+
+    with zipfile.ZipFile(kmz_file, 'w', compression=zipfile.ZIP_DEFLATED) as kmz:
+        with ProcessPoolExecutor(max_workers=workers) as rotate_pool:
+            window = 2 * (workers or os.cpu_count() or 1)
+            if preview_long_edge:
+                # The previews are upright already, the orientation is applied while they are built
+                preview_tasks = ((filename, make_preview, os.path.join(folder_path, filename), preview_cache_folder, preview_long_edge)
+                                 for filename in image_data)
+                for filename, preview_path in iter_bounded_results(rotate_pool, preview_tasks, window):
+                    sources[filename] = (preview_arcname(filename), sources[filename][1])
+                    kmz.write(preview_path, arcname=sources[filename][0], compress_type=zipfile.ZIP_STORED)
+                angles = {}
+            rotate_tasks = []
+            for filename, orientation in angles.items():
+                image_path = os.path.join(folder_path, filename)
+                if orientation is None:
+                    # Already upright (or left to the viewer), nothing to decode
+                    kmz.write(image_path, arcname="files/" + filename, compress_type=zipfile.ZIP_STORED)
+                elif rotation_mode == "lossless":
+                    rotate_tasks.append((filename, rotate_image_lossless, image_path, orientation))
+                else:
+                    rotate_tasks.append((filename, reencode_upright, image_path, orientation))
+            if rotation_mode == "lossless" and rotate_tasks and shutil.which("jpegtran") is None:
+                print("Warning: jpegtran was not found on the PATH, the rotated photos are re-encoded with PIL instead of rotated losslessly.")
+            for filename, image_bytes in iter_bounded_results(rotate_pool, rotate_tasks, window):
+                kmz.writestr("files/" + filename, image_bytes, compress_type=zipfile.ZIP_STORED)
+
+        image_style = "max-width:1500px;"
+        if rotation_mode == "metadata" and not preview_long_edge:
+            image_style += " image-orientation:from-image;"
+        if tile_capacity:
+            write_tiled_kml(kmz, image_data,
+                            lambda kml_stream, tile_data, src_prefix: write_placemarks(kml_stream, tile_data, image_style, sources, src_prefix),
+                            capacity=tile_capacity)
+        else:
+            with io.TextIOWrapper(kmz.open("doc.kml", "w"), encoding="utf-8") as kml_stream:
+                write_kml(kml_stream, image_data, image_style, sources)
+
+    return image_data
+
 # Function to create a KML file containing the GPS data of images
 def create_kml(kml_file_path, image_data):
     """
@@ -165,11 +411,19 @@ def create_kmz(output_path, kml_file, files_folder):
                 kmz.write(os.path.join(root, file), arcname=os.path.join("files", file))
 
 # Main function to process images, rotate them if necessary, and create a KMZ file
-def main():
+def main(pipelined=True, workers=None, rotation_mode="lossless", preview_long_edge=None, link_originals=False, tile_capacity=None):
     """
     Main function to process images in the current directory, extract their GPS data,
     rotate them according to their EXIF orientation, and create a KMZ file containing
     a KML file with the image GPS data and the rotated images.
+
+    Parameters:
+    pipelined (bool): Use the parallel pipeline (create_kmz_pipelined), False for the older serial version.
+    workers (int): Number of worker processes for the rotation in the pipelined mode, None for one per core.
+    rotation_mode (str): How the pipelined mode brings photos upright, "lossless", "metadata" or "reencode".
+    preview_long_edge (int): In the pipelined mode, embed previews with this long edge in pixels instead of the photos.
+    link_originals (bool): In the pipelined mode, link each placemark to the original photo on disk.
+    tile_capacity (int): In the pipelined mode, split the placemarks into region based tiles of at most this many photos.
     """
     # For pyinstaller build, use the following line.
     #folder_path =os.path.dirname(sys.executable)
@@ -179,6 +433,11 @@ def main():
     kml_file = os.path.join(folder_path, "doc.kml")
     kmz_file = os.path.join(folder_path, "photo_data.kmz")
 
+    if pipelined:
+        create_kmz_pipelined(folder_path, kmz_file, workers, rotation_mode, preview_long_edge, link_originals, tile_capacity)
+        print(f"KMZ file has been created: {kmz_file}")
+        return
+
     # Create the "files" directory if it doesn't exist
     if not os.path.exists(files_folder):
         os.makedirs(files_folder)
@@ -188,21 +447,11 @@ def main():
     for filename in os.listdir(folder_path):
         if filename.lower().endswith((".jpg", ".jpeg", ".png", ".gif", ".bmp")):
             image_path = os.path.join(folder_path, filename)
-            latitude, longitude, altitude = extract_gps_data(image_path)
+            # GPS and orientation come from one read of the Exif header
+            info = read_photo_info(image_path)
+            latitude, longitude, altitude = info["latitude"], info["longitude"], info["altitude"]
             if latitude is not None and longitude is not None:
-                orientation = get_image_orientation(image_path)
-                
-                if orientation:
-                    if orientation == 3:
-                        angle = 180  # Rotate 180 degrees
-                    elif orientation == 6:
-                        angle = 270  # Rotate 270 degrees (or -90)
-                    elif orientation == 8:
-                        angle = 90  # Rotate 90 degrees
-                    else:
-                        angle = 0  # No rotation needed
-                else:
-                    angle = 0  # No rotation needed
+                angle = get_rotation_angle(info["orientation"])
                 
                 rotated_image_path = os.path.join(files_folder, filename)
                 rotate_image(image_path, rotated_image_path, angle)
@@ -227,4 +476,6 @@ def main():
     print(f"KMZ file has been created: {kmz_file}")
 
 if __name__ == "__main__":
+    # Needed for the rotation process pool in the pyinstaller built executable
+    multiprocessing.freeze_support()
     main()
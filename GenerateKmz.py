@@ -1,44 +1,25 @@
 import os
+import io
+import sys
+import json
+import hashlib
 import zipfile
-from PIL import Image
-from PIL.ExifTags import TAGS, GPSTAGS
-import shutil
+from pathlib import Path
+from ExifHeaderReader import read_photo_info
+from PhotoPreviewCache import make_preview, preview_arcname
+from KmlRegionTiler import write_tiled_kml
 
 # This script can be built into a exe using pyinstaller. 
 # Put the script or exe into the same folder with photos (photos with location data in their exif)
 # double click the script or exe, it will generate a kmz file that contain photo and a kml file.
 # you can then drag and drop the kmz to a Google Earth app window, and view the photos by location in Google Earth.
 
-def convert_to_decimal_degrees(coord, ref):
-    degrees = coord[0]
-    minutes = coord[1]
-    seconds = coord[2]
-    decimal_degrees = degrees + (minutes / 60.0) + (seconds / 3600.0)
-    
-    # Adjust sign based on hemisphere reference
-    if ref in ['S', 'W']:
-        decimal_degrees = -decimal_degrees
-    
-    return decimal_degrees
-
+# GPS data is read from the Exif header only, see ExifHeaderReader.py
 def extract_gps_data(image_path):
-    try:
-        with Image.open(image_path) as img:
-            exif_data = img._getexif()
-            if exif_data and 34853 in exif_data:
-                gps_data = exif_data[34853]  # GPSInfo tag
-
-                latitude = convert_to_decimal_degrees(gps_data[2], gps_data[1])  # GPS latitude
-                longitude = convert_to_decimal_degrees(gps_data[4], gps_data[3])  # GPS longitude
-                altitude = gps_data[6] if 6 in gps_data else None  # GPS altitude
-                
-                return latitude, longitude, altitude
-    except Exception as e:
-        print(f"Error processing {image_path}: {e}")
-    return None, None, None
+    info = read_photo_info(image_path)
+    return info["latitude"], info["longitude"], info["altitude"]
 
-def create_kml(kml_file_path, image_data):
-    kml_content = """<?xml version="1.0" encoding="UTF-8"?>
+KML_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
 <kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2" xmlns:kml="http://www.opengis.net/kml/2.2" xmlns:atom="http://www.w3.org/2005/Atom">
 <Document>
     <name>photo_data.kmz</name>
@@ -46,24 +27,46 @@ def create_kml(kml_file_path, image_data):
         <name>Photo Points</name>
     """
 
-    for img_name, (lat, lon, alt) in image_data.items():
-        kml_content += f"""
+KML_PLACEMARK = """
         <Placemark>
             <name>{img_name}</name>
-            <description><![CDATA[<img style="max-width:1500px;" src="files/{img_name}">]]></description>
+            <description><![CDATA[<img style="max-width:1500px;" src="{src}">{link}]]></description>
             <Point>
-                <coordinates>{lon},{lat},{alt or 0}</coordinates>
+                <coordinates>{lon},{lat},{alt}</coordinates>
             </Point>
         </Placemark>
         """
-    
-    kml_content += """
+
+KML_FOOTER = """
     </Folder>
 </Document>
 </kml>
 """
+
+# Photo formats that are already compressed, they are stored in the kmz as they are instead of deflated again
+STORED_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif")
+
+# Link to the original photo on disk, shown under the preview in the placemark balloon
+KML_ORIGINAL_LINK = '<br><a href="{uri}">Original photo</a>'
+
+# Write the placemarks to an open text stream one at a time, instead of growing one big string.
+# sources optionally maps an image name to (path inside the kmz, path of the original photo or None),
+# by default the photo is files/<image name> without a link. src_prefix is put in front of the photo path,
+# "../" for the tile kml files in the tiles folder of the kmz.
+def write_placemarks(kml_stream, image_data, sources=None, src_prefix=""):
+    for img_name, (lat, lon, alt) in image_data.items():
+        src, original_path = sources.get(img_name, ("files/" + img_name, None)) if sources else ("files/" + img_name, None)
+        link = KML_ORIGINAL_LINK.format(uri=Path(original_path).resolve().as_uri()) if original_path else ""
+        kml_stream.write(KML_PLACEMARK.format(img_name=img_name, src=src_prefix + src, link=link, lat=lat, lon=lon, alt=alt or 0))
+
+def write_kml(kml_stream, image_data, sources=None):
+    kml_stream.write(KML_HEADER)
+    write_placemarks(kml_stream, image_data, sources)
+    kml_stream.write(KML_FOOTER)
+
+def create_kml(kml_file_path, image_data):
     with open(kml_file_path, 'w') as kml_file:
-        kml_file.write(kml_content)
+        write_kml(kml_file, image_data)
 
 def create_kmz(output_path, kml_file, files_folder):
     with zipfile.ZipFile(output_path, 'w') as kmz:
@@ -72,35 +75,209 @@ def create_kmz(output_path, kml_file, files_folder):
             for file in files:
                 kmz.write(os.path.join(root, file), arcname=os.path.join("files", file))
 
-def main():
-    # For direct use, use the following line
-    #folder_path = os.path.dirname(os.path.abspath(__file__))
-    # For pyinstaller build, use the following line.
-    folder_path =os.path.dirname(sys.executable)
-    files_folder = os.path.join(folder_path, "files")
-    kml_file = os.path.join(folder_path, "doc.kml")
-    kmz_file = os.path.join(folder_path, "photo_data.kmz")
+# Write one photo (or its preview) into the open kmz and return its path inside the kmz
+def write_photo(kmz, image_path, filename, preview_long_edge=None, preview_cache_folder=None):
+    if preview_long_edge:
+        arcname = preview_arcname(filename)
+        kmz.write(make_preview(image_path, preview_cache_folder, preview_long_edge), arcname=arcname,
+                  compress_type=zipfile.ZIP_STORED)
+    else:
+        arcname = "files/" + filename
+        compress_type = zipfile.ZIP_STORED if filename.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+        kmz.write(image_path, arcname=arcname, compress_type=compress_type)
+    return arcname
 
-    # Create the "files" directory if it doesn't exist
-    if not os.path.exists(files_folder):
-        os.makedirs(files_folder)
+# Write doc.kml (and the tile kml files with tile_capacity set) into the open kmz, after the photos
+def write_kml_entries(kmz, image_data, sources, tile_capacity=None):
+    if tile_capacity:
+        write_tiled_kml(kmz, image_data, lambda kml_stream, tile_data, src_prefix: write_placemarks(kml_stream, tile_data, sources, src_prefix),
+                        capacity=tile_capacity)
+    else:
+        with io.TextIOWrapper(kmz.open("doc.kml", "w"), encoding="utf-8") as kml_stream:
+            write_kml(kml_stream, image_data, sources)
 
+# Build the kmz in one pass, without the temporary "files" folder and doc.kml on disk.
+# Each photo with GPS data is streamed from its original location straight into the zip (jpg/png/gif stored, not recompressed),
+# and doc.kml is streamed into the zip afterwards, placemark by placemark.
+# With preview_long_edge set, a resized preview (see PhotoPreviewCache.py) is embedded instead of the full resolution photo,
+# the previews are cached in preview_cache_folder for the next run. link_originals adds a link to the original photo on disk.
+# With tile_capacity set, the placemarks go into region based tile kml files of at most tile_capacity photos (see KmlRegionTiler.py)
+# instead of one flat doc.kml, so Google Earth only loads the photos of the area on screen.
+def create_kmz_streaming(output_path, folder_path, filenames, preview_long_edge=None, link_originals=False, preview_cache_folder=None,
+                         tile_capacity=None):
+    if preview_cache_folder is None:
+        preview_cache_folder = os.path.join(folder_path, ".kmz_preview_cache")
     image_data = {}
-    
-    for filename in os.listdir(folder_path):
-        if filename.lower().endswith((".jpg", ".jpeg", ".png", ".gif", ".bmp")):
+    sources = {}
+    with zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED) as kmz:
+        for filename in filenames:
             image_path = os.path.join(folder_path, filename)
             latitude, longitude, altitude = extract_gps_data(image_path)
             if latitude is not None and longitude is not None:
+                arcname = write_photo(kmz, image_path, filename, preview_long_edge, preview_cache_folder)
                 image_data[filename] = (latitude, longitude, altitude)
-                shutil.copy(image_path, os.path.join(files_folder, filename))
+                sources[filename] = (arcname, image_path if link_originals else None)
+
+        write_kml_entries(kmz, image_data, sources, tile_capacity)
+    return image_data
+
+# Incremental mode.
+# A sidecar index (<kmz>.index.json) keeps size, mtime, GPS data, sha1 and the path inside the kmz of every photo of the last run,
+# so a rerun only stats the unchanged photos. New photos are appended to the existing kmz: the kml entries at the end
+# of the zip are cut off, the new photos are written in their place, and the kml is written again for all photos.
+# Removed photos only change the kml, their entries are dropped from the zip directory (the bytes stay in the file
+# until the next full rebuild). A full rebuild happens when the index or kmz is missing or unreadable, the settings changed,
+# or the content of an embedded photo changed (zip entries can not be replaced in place).
+KMZ_INDEX_VERSION = 1
+
+def file_sha1(path):
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            sha1.update(block)
+    return sha1.hexdigest()
 
-    create_kml(kml_file, image_data)
-    create_kmz(kmz_file, kml_file, files_folder)
+def load_kmz_index(index_path):
+    try:
+        with open(index_path, "r", encoding="utf-8") as index_file:
+            index = json.load(index_file)
+    except (OSError, ValueError):
+        return None
+    return index if index.get("version") == KMZ_INDEX_VERSION else None
+
+def save_kmz_index(index_path, index):
+    temp_path = index_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as index_file:
+        json.dump(index, index_file)
+    os.replace(temp_path, index_path)
+
+# The only code in this script that touches private zipfile state, kept in one place. The public API can not remove
+# entries or move the write position of an archive opened in append mode, and rewriting the kmz through the public
+# API would copy every photo again, which is what the incremental mode avoids.
+# It relies on these CPython zipfile internals, which have no stability guarantee:
+#   ZipFile.start_dir   offset where the next entry (or the central directory on close) is written in append mode
+#   ZipFile.filelist    list of the ZipInfo written to the central directory on close
+#   ZipFile.NameToInfo  name -> ZipInfo lookup used by getinfo(), open() and the duplicate name check
+#   ZipFile._didModify  makes close() write the central directory, and truncate the file after it in append mode
+# If a Python release removes them, truncate_kml_entries returns False and update_kmz_incremental does a full rebuild.
+def rewind_zip_directory(zip_file, keep_infos, write_offset):
+    zip_file.start_dir = write_offset
+    zip_file.filelist = list(keep_infos)
+    zip_file.NameToInfo = {info.filename: info for info in zip_file.filelist}
+    zip_file._didModify = True
+
+# Prepare a kmz opened in append mode for new entries: drop every entry not in keep_arcnames from the zip directory,
+# and move the write position back to the first kml entry so the kml files are overwritten (rewind_zip_directory).
+# Returns False if the kmz does not have the layout written by this script (photos first, kml files last),
+# or if this Python's zipfile does not have the internals rewind_zip_directory relies on.
+def truncate_kml_entries(kmz, keep_arcnames):
+    if not all(hasattr(kmz, name) for name in ("start_dir", "filelist", "NameToInfo", "_didModify")):
+        return False
+    entries = sorted(kmz.infolist(), key=lambda info: info.header_offset)
+    first_kml = next((i for i, info in enumerate(entries) if info.filename.lower().endswith(".kml")), len(entries))
+    if not all(info.filename.lower().endswith(".kml") for info in entries[first_kml:]):
+        return False
+    photo_names = {info.filename for info in entries[:first_kml]}
+    if not set(keep_arcnames) <= photo_names:
+        return False
+
+    write_offset = entries[first_kml].header_offset if first_kml < len(entries) else kmz.start_dir
+    rewind_zip_directory(kmz, [info for info in entries[:first_kml] if info.filename in keep_arcnames], write_offset)
+    return True
+
+def update_kmz_incremental(output_path, folder_path, filenames, preview_long_edge=None, link_originals=False, preview_cache_folder=None,
+                           tile_capacity=None, index_path=None, rebuild=False):
+    if preview_cache_folder is None:
+        preview_cache_folder = os.path.join(folder_path, ".kmz_preview_cache")
+    if index_path is None:
+        index_path = output_path + ".index.json"
+    settings = {"preview_long_edge": preview_long_edge, "link_originals": link_originals, "tile_capacity": tile_capacity}
+
+    index = load_kmz_index(index_path)
+    if index is None or index.get("settings") != settings or not os.path.exists(output_path):
+        rebuild = True
+    old_photos = {} if rebuild else index["photos"]
+
+    photos = {}
+    new_filenames = []
+    for filename in filenames:
+        image_path = os.path.join(folder_path, filename)
+        stat = os.stat(image_path)
+        entry = old_photos.get(filename)
+        if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime_ns:
+            photos[filename] = entry
+            continue
+        sha1 = file_sha1(image_path)
+        if entry and entry["sha1"] == sha1:
+            # Touched or copied again, but the same photo
+            photos[filename] = dict(entry, mtime=stat.st_mtime_ns)
+            continue
+        if entry and entry["arcname"]:
+            rebuild = True
+        latitude, longitude, altitude = extract_gps_data(image_path)
+        photos[filename] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sha1": sha1,
+                            "latitude": latitude, "longitude": longitude, "altitude": altitude, "arcname": None}
+        new_filenames.append(filename)
+
+    removed = [entry["arcname"] for filename, entry in old_photos.items() if filename not in photos and entry["arcname"]]
+    if not rebuild and not removed and not any(photos[filename]["latitude"] is not None for filename in new_filenames):
+        save_kmz_index(index_path, {"version": KMZ_INDEX_VERSION, "settings": settings, "photos": photos})
+        return None
+
+    kmz = None
+    if not rebuild:
+        keep_arcnames = {entry["arcname"] for entry in photos.values() if entry["arcname"]}
+        try:
+            kmz = zipfile.ZipFile(output_path, 'a', compression=zipfile.ZIP_DEFLATED)
+        except zipfile.BadZipFile:
+            kmz = None
+        if kmz is not None and not truncate_kml_entries(kmz, keep_arcnames):
+            kmz.close()
+            kmz = None
+    if kmz is None:
+        # Full rebuild, every photo is written again
+        for entry in photos.values():
+            entry["arcname"] = None
+        new_filenames = list(filenames)
+        kmz = zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    with kmz:
+        for filename in new_filenames:
+            entry = photos[filename]
+            if entry["latitude"] is not None and entry["longitude"] is not None:
+                entry["arcname"] = write_photo(kmz, os.path.join(folder_path, filename), filename, preview_long_edge, preview_cache_folder)
+
+        image_data = {}
+        sources = {}
+        for filename in filenames:
+            entry = photos[filename]
+            if entry["arcname"]:
+                image_data[filename] = (entry["latitude"], entry["longitude"], entry["altitude"])
+                sources[filename] = (entry["arcname"], os.path.join(folder_path, filename) if link_originals else None)
+        write_kml_entries(kmz, image_data, sources, tile_capacity)
+
+    save_kmz_index(index_path, {"version": KMZ_INDEX_VERSION, "settings": settings, "photos": photos})
+    return image_data
+
+# preview_long_edge: embed previews with this long edge in pixels instead of the originals, e.g. 1500 to match the balloon width
+# link_originals: link each placemark to the original photo on disk
+# tile_capacity: split the placemarks into region based tiles of at most this many photos, e.g. 256 for tens of thousands of photos
+# incremental: update the kmz of the last run with the new and removed photos, see update_kmz_incremental
+def main(preview_long_edge=None, link_originals=False, tile_capacity=None, incremental=False):
+    # For direct use, use the following line
+    #folder_path = os.path.dirname(os.path.abspath(__file__))
+    # For pyinstaller build, use the following line.
+    folder_path =os.path.dirname(sys.executable)
+    kmz_file = os.path.join(folder_path, "photo_data.kmz")
 
-    # Clean up temporary files
-    os.remove(kml_file)
-    shutil.rmtree(files_folder)
+    filenames = [filename for filename in os.listdir(folder_path)
+                 if filename.lower().endswith((".jpg", ".jpeg", ".png", ".gif", ".bmp"))]
+    if incremental:
+        if update_kmz_incremental(kmz_file, folder_path, sorted(filenames), preview_long_edge, link_originals, tile_capacity=tile_capacity) is None:
+            print(f"KMZ file is up to date: {kmz_file}")
+            return
+    else:
+        create_kmz_streaming(kmz_file, folder_path, filenames, preview_long_edge, link_originals, tile_capacity=tile_capacity)
 
     print(f"KMZ file has been created: {kmz_file}")
 
@@ -10,6 +10,10 @@
 
 
 import datetime
+import numpy as np
+
+# Elevation written for every point
+ELEVATION = 1.0
 
 def interpolate_coords(start_coords, end_coords, fraction):
     """
@@ -110,8 +114,103 @@ def generate_gpx(start_datetime, key_points):
     
     return "\n".join(gpx_content)
 
-def main(input_filename, output_filename):
+def interpolate_coords_array(start_coords, end_coords, fractions, great_circle=False):
+    """
+    Interpolate between two coordinates for a whole array of fractions at once.
+    :param start_coords: tuple of (lat, lon) for the start point
+    :param end_coords: tuple of (lat, lon) for the end point
+    :param fractions: NumPy array of fractions of the way between start and end (0.0 - 1.0)
+    :param great_circle: interpolate along the great circle instead of linearly in lat/lon
+    :return: tuple of (lat, lon) NumPy arrays
+    """
+    if not great_circle:
+        lats = start_coords[0] + (end_coords[0] - start_coords[0]) * fractions
+        lons = start_coords[1] + (end_coords[1] - start_coords[1]) * fractions
+        return lats, lons
+
+    # Spherical linear interpolation between the two points as unit vectors
+    lat0, lon0, lat1, lon1 = np.radians([start_coords[0], start_coords[1], end_coords[0], end_coords[1]])
+    v0 = np.array([np.cos(lat0) * np.cos(lon0), np.cos(lat0) * np.sin(lon0), np.sin(lat0)])
+    v1 = np.array([np.cos(lat1) * np.cos(lon1), np.cos(lat1) * np.sin(lon1), np.sin(lat1)])
+    omega = np.arccos(np.clip(np.dot(v0, v1), -1.0, 1.0))
+    if omega < 1e-12:
+        return interpolate_coords_array(start_coords, end_coords, fractions)
+    weight0 = np.sin((1 - fractions) * omega) / np.sin(omega)
+    weight1 = np.sin(fractions * omega) / np.sin(omega)
+    v = np.outer(weight0, v0) + np.outer(weight1, v1)
+    lats = np.degrees(np.arcsin(np.clip(v[:, 2], -1.0, 1.0)))
+    lons = np.degrees(np.arctan2(v[:, 1], v[:, 0]))
+    return lats, lons
+
+def format_trkpts(lats, lons, times, time_unit):
+    """
+    Format arrays of points into the <trkpt> lines, same layout as generate_gpx.
+    """
+    time_strings = np.datetime_as_string(times, unit=time_unit)
+    return [f'<trkpt lon="{lon:.9f}" lat="{lat:.9f}">\n<ele>{ELEVATION}</ele>\n<time>{time_string}Z</time>\n</trkpt>'
+            for lat, lon, time_string in zip(lats.tolist(), lons.tolist(), time_strings.tolist())]
+
+def write_gpx_streaming(start_datetime, key_points, output_file, points_per_second=1, great_circle=False, chunk_size=100000):
+    """
+    Array based version of generate_gpx. All timestamps and coordinates of a segment are computed as NumPy arrays,
+    in slices of at most chunk_size points, and each slice is written to output_file right away instead of
+    joining one giant string. points_per_second sets the output rate, e.g. 30 to match video frames.
+    With points_per_second=1 and linear interpolation the output is the same as generate_gpx.
+    """
+    min_lat = min([coords[1][0] for coords in key_points])
+    max_lat = max([coords[1][0] for coords in key_points])
+    min_lon = min([coords[1][1] for coords in key_points])
+    max_lon = max([coords[1][1] for coords in key_points])
+    header = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        '<gpx version="1.1" creator="CompanyName" xmlns="http://www.topografix.com/GPX/1/1">',
+        '<metadata>',
+        '<link href="https://www.company.com">',
+        '<text>Description</text>',
+        '</link>',
+        f'<time>{start_datetime.isoformat()}Z</time>',
+        f'<bounds minlat="{min_lat}" maxlat="{max_lat}" minlon="{min_lon}" maxlon="{max_lon}"/>',
+        '</metadata>',
+        '<trk>',
+        '<name>360 Video GPS Data</name>',
+        '<trkseg>',
+    ]
+    output_file.write("\n".join(header))
+
+    # Whole seconds at 1 point per second, like generate_gpx, milliseconds for higher rates
+    time_unit = 's' if points_per_second == 1 else 'ms'
+    start_time = np.datetime64(start_datetime, 'ms')
+
+    total_seconds = 0
+    for i in range(len(key_points) - 1):
+        segment_start_time, start_coords = key_points[i]
+        segment_end_time, end_coords = key_points[i+1]
+        segment_seconds = int((segment_end_time - segment_start_time).total_seconds())
+        segment_points = segment_seconds * points_per_second
+
+        for first in range(0, segment_points, chunk_size):
+            steps = np.arange(first, min(first + chunk_size, segment_points))
+            lats, lons = interpolate_coords_array(start_coords, end_coords, steps / segment_points, great_circle)
+            offsets_ms = np.round((total_seconds + steps / points_per_second) * 1000).astype(np.int64)
+            times = start_time + offsets_ms.astype('timedelta64[ms]')
+            output_file.write("\n" + "\n".join(format_trkpts(lats, lons, times, time_unit)))
+
+        total_seconds += segment_seconds
+
+    # Add the final key point
+    final_time, final_coords = key_points[-1]
+    final_times = start_time + np.array([total_seconds * 1000], dtype='timedelta64[ms]')
+    output_file.write("\n" + "\n".join(format_trkpts(np.array([final_coords[0]]), np.array([final_coords[1]]), final_times, time_unit)))
+    output_file.write("\n</trkseg>\n</trk>\n</gpx>")
+
+def main(input_filename, output_filename, points_per_second=1, great_circle=False, use_arrays=True):
     start_datetime, key_points = parse_input_file(input_filename)
+
+    if use_arrays:
+        with open(output_filename, 'w') as output_file:
+            write_gpx_streaming(start_datetime, key_points, output_file, points_per_second, great_circle)
+        return
+
     gpx_content = generate_gpx(start_datetime, key_points)
     
     with open(output_filename, 'w') as output_file:
@@ -121,3 +220,5 @@ if __name__ == "__main__":
     input_filename = "input.txt"  # Replace with your input file path
     output_filename = "output.gpx"  # Replace with your desired output file path
     main(input_filename, output_filename)
+    # For one point per video frame, e.g. 30 fps, along the great circle between the picked points
+    #main(input_filename, output_filename, points_per_second=30, great_circle=True)
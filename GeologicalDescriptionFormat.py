@@ -0,0 +1,90 @@
+"""
+Text transforms of the geological descriptions and notes, used by FromDocxTableToExcelFile.py.
+
+The regular expressions are compiled once at import instead of being looked up for every cell, and the results
+are kept in a bounded LRU memo: the same Munsell strings ("10YR 4/3 brown"), legend codes and notes repeat
+thousands of times across a project, so most cells are a dictionary lookup.
+The memo holds at most CACHE_SIZE entries per transform. The uncached version of each transform is available
+as <function>.__wrapped__ (used by GeologicalDescriptionFormatBenchmark.py).
+
+Cached results are shared between calls, so split_notes_into_rows returns tuples instead of lists.
+"""
+
+import re
+from functools import lru_cache
+
+CACHE_SIZE = 4096
+
+# 'and' / 'to' between the color parts of a description
+COLOR_PART_SEPARATOR = re.compile(r'\s+and\s+|\s+to\s+')
+# Munsell color followed by the color name, like "10YR 4/3 brown"
+MUNSELL_COLOR = re.compile(r'(\d+(\.\d+)?[A-Z]+\s\d+/\d+)\s(.+)')
+# Legend code in square brackets
+LEGEND_CODE = re.compile(r'\[(.*?)\]')
+LEGEND_CODE_REMOVE = re.compile(r'\[.*?\]')
+# Note numbering (1), (2), (3), ... or *
+NOTE_NUMBER = re.compile(r'(\(\d+\)\s*|\*\s*)')
+# Numbers of the note references in the notes column of table 2, like "(1), (2)" or "(1,2)" or "(12)"
+NOTE_REFERENCE_NUMBER = re.compile(r'\d+')
+
+
+# This is for reformat the color description. Since the original document put color after the numbers, we need separte them and move the color forward.
+# pay attention to the and/or situation.
+@lru_cache(maxsize=CACHE_SIZE)
+def reformat_color_description(description):
+    # Split the description by 'and' or 'to' to handle multiple color parts
+    parts = COLOR_PART_SEPARATOR.split(description)
+
+    formatted_parts = []
+    for part in parts:
+        # Match the Munsell color and the color name
+        match = MUNSELL_COLOR.match(part)
+        if match:
+            munsell_code = '[' + match.group(1) +']'
+            color_name = match.group(3)
+            formatted_parts.append(f"{color_name} {munsell_code}")
+
+    # Join the formatted parts with 'and' if there are multiple parts
+    return ' and '.join(formatted_parts)
+
+# This is for extracting the legend code from [....]
+@lru_cache(maxsize=CACHE_SIZE)
+def extract_legend_code(description):
+    match = LEGEND_CODE.search(description)
+    return match.group(1) if match else ""
+
+# Remove legend code from the cell data.
+@lru_cache(maxsize=CACHE_SIZE)
+def remove_legend_code(description):
+    return LEGEND_CODE_REMOVE.sub('', description).strip()
+
+# Function to format and split notes(in table3) into individual points
+@lru_cache(maxsize=CACHE_SIZE)
+def split_notes_into_rows(notes):
+    # Use regex to split the notes by the pattern (1), (2), (3), ... or *
+    split_notes = NOTE_NUMBER.split(notes)
+    # Combine the split notes to include the numbering or asterisk with the text, also assemble them into pairs, so the first part of pair is just numbering,
+    # like (1), (2) ..... Can be used to match the values in table2
+    return tuple((split_notes[i].strip(), split_notes[i].strip() + split_notes[i+1].strip()) for i in range(1, len(split_notes), 2))
+
+# Keys of the notes a table 2 notes cell refers to: every number, and "*" if the cell has one
+@lru_cache(maxsize=CACHE_SIZE)
+def note_reference_keys(notes_cell):
+    keys = NOTE_REFERENCE_NUMBER.findall(notes_cell)
+    if "*" in notes_cell:
+        keys.append("*")
+    return tuple(keys)
+
+# Key of a note numbering from split_notes_into_rows, "(12)" -> "12", "*" -> "*"
+def note_key(note_number):
+    numbers = NOTE_REFERENCE_NUMBER.findall(note_number)
+    return numbers[0] if numbers else note_number.strip()
+
+
+def cache_info():
+    """
+    {transform name: functools cache statistics} of the cached transforms.
+    """
+    return {function.__name__: function.cache_info()
+            for function in (reformat_color_description, extract_legend_code, remove_legend_code, split_notes_into_rows,
+                             note_reference_keys)}
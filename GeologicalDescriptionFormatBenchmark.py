@@ -0,0 +1,81 @@
+"""
+Micro-benchmark of the transforms in GeologicalDescriptionFormat.py, over the cells of a boring log docx
+(by default the bundled FromDocxTableToExcelFileExample.docx).
+
+The cells each transform sees in FromDocxTableToExcelFile.py are collected from table 2 and table 3 of every page,
+then each transform runs over them `repeat` times: once without the memo (the precompiled patterns only, .__wrapped__)
+and once with it, starting from an empty cache. Rows per second are printed per transform, so a slower pattern or
+a broken cache shows up as a drop between runs.
+
+Run:
+    python GeologicalDescriptionFormatBenchmark.py [docx path] [repeat]
+"""
+
+import sys
+import time
+import GeologicalDescriptionFormat as formatting
+from FromDocxTableToExcelFile import iter_docx_components
+
+
+def collect_transform_inputs(docx_path):
+    """
+    Return {transform name: list of cell texts} with the cells main() of FromDocxTableToExcelFile.py passes to each transform.
+    """
+    inputs = {"reformat_color_description": [], "extract_legend_code": [], "remove_legend_code": [], "split_notes_into_rows": []}
+    current_title = None
+    table_counter = 0
+    for component in iter_docx_components(docx_path):
+        if component[0] == 'Paragraph' and len(component[1]) > 1:
+            current_title = component[1]
+        elif component[0] == 'Table' and current_title:
+            table_counter += 1
+            table = component[1]
+            if table_counter == 2:
+                for row in table[2:]:
+                    inputs["reformat_color_description"].append(row[2])
+                    if row[4] != "-":
+                        inputs["reformat_color_description"].append(row[4])
+                    inputs["extract_legend_code"].append(row[5])
+                    inputs["remove_legend_code"].append(row[5])
+            elif table_counter == 3:
+                inputs["split_notes_into_rows"].extend(row[0] for row in table[1:])
+                table_counter = 0
+    return inputs
+
+
+def time_transform(function, cells, repeat):
+    """
+    Run function over the cells repeat times, return (rows per second, results of the last pass).
+    """
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        results = [function(cell) for cell in cells]
+    elapsed = time.perf_counter() - start_time
+    return (len(cells) * repeat / elapsed if elapsed > 0 else float("inf")), results
+
+
+def run_benchmark(docx_path="FromDocxTableToExcelFileExample.docx", repeat=2000):
+    """
+    Time every transform uncached and cached, print and return {transform name: (uncached rows/s, cached rows/s)}.
+    """
+    inputs = collect_transform_inputs(docx_path)
+    rates = {}
+    print(f"{'transform':<28} {'cells':>6} {'uncached rows/s':>16} {'cached rows/s':>14}")
+    for name, cells in inputs.items():
+        function = getattr(formatting, name)
+        if not cells:
+            continue
+        uncached_rate, uncached_results = time_transform(function.__wrapped__, cells, repeat)
+        function.cache_clear()
+        cached_rate, cached_results = time_transform(function, cells, repeat)
+        if uncached_results != cached_results:
+            raise AssertionError(f"{name}: cached results differ from uncached results")
+        rates[name] = (uncached_rate, cached_rate)
+        print(f"{name:<28} {len(cells):>6} {uncached_rate:>16,.0f} {cached_rate:>14,.0f}")
+    return rates
+
+
+if __name__ == "__main__":
+    docx_path = sys.argv[1] if len(sys.argv) > 1 else "FromDocxTableToExcelFileExample.docx"
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    run_benchmark(docx_path, repeat)
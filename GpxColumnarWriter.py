@@ -0,0 +1,129 @@
+"""
+Columnar output (Parquet or Feather) for the GPX path tables of CalculateGpxPathOnMap.py and GPXtoCSV.py.
+
+The csv outputs are text, so the plotting and video sync tools re-parse every number on each load,
+and the constant columns (northing, easting, elevationFt, xdimM, ydimM, filename) are repeated for every point.
+The columnar files keep typed float / timestamp columns and a dictionary encoded filename column.
+The timestamp columns are timezone naive and hold the wall clock time as written in the GPX file, a UTC offset like
++02:00 is dropped without converting (GpxStreamReader.times_to_datetime64), the same time the csv outputs show.
+
+The format follows the file extension:
+    .parquet          Parquet, compressed, the constant columns shrink to almost nothing.
+    .feather/.arrow   Feather v2 (Arrow IPC file), uncompressed so it can be memory mapped and loaded without copying.
+
+Read the tables back with read_columnar_table(path), which memory maps the file.
+"""
+
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Column types of gpx_data from CalculateGpxPathOnMap.py
+GPX_PATH_COLUMN_TYPES = {
+    "count": pa.int32(),
+    "latitude": pa.float64(),
+    "longitude": pa.float64(),
+    "elevationM": pa.float64(),
+    "timestamp": pa.timestamp("ms"),
+    "northing": pa.float64(),
+    "easting": pa.float64(),
+    "elevationFt": pa.float64(),
+    "positionX": pa.float64(),
+    "positionY": pa.float64(),
+    "positionZ": pa.float64(),
+    "xdimM": pa.float64(),
+    "ydimM": pa.float64(),
+    "filename": pa.dictionary(pa.int32(), pa.string()),
+}
+
+# Column types of the point table from GPXtoCSV.py
+GPX_POINT_COLUMN_TYPES = {
+    "sequence": pa.int64(),
+    "latitude": pa.float64(),
+    "longitude": pa.float64(),
+    "elevation": pa.float64(),
+    "timestamp": pa.timestamp("ms"),
+}
+
+
+def columnar_format(output_path):
+    """
+    "parquet" or "feather" from the file extension.
+    """
+    extension = os.path.splitext(output_path)[1].lower()
+    if extension == ".parquet":
+        return "parquet"
+    if extension in (".feather", ".arrow"):
+        return "feather"
+    raise ValueError(f"Unknown columnar format for {output_path}, use .parquet, .feather or .arrow")
+
+
+class GpxColumnarWriter:
+    """
+    Write a GPX table batch by batch. Each batch is a dict of columns, NumPy arrays with one value per point
+    or plain scalars for the constant columns (the dicts of CalculateGpxPathOnMap.build_segment_columns).
+    NaN / NaT values are stored as nulls.
+
+    The filename column is dictionary encoded with one dictionary for the whole file, so every filename
+    that will be written has to be passed in filenames (the Arrow IPC file format does not allow the
+    dictionary to change between batches).
+    """
+
+    def __init__(self, output_path, column_types, filenames=()):
+        self.output_path = output_path
+        self.format = columnar_format(output_path)
+        self.schema = pa.schema([pa.field(name, column_type) for name, column_type in column_types.items()])
+        self.filename_dictionary = pa.array(sorted(set(filenames)), type=pa.string())
+        self.filename_index = {name: index for index, name in enumerate(self.filename_dictionary.to_pylist())}
+        self.rows = 0
+        if self.format == "parquet":
+            self.sink = None
+            self.writer = pq.ParquetWriter(output_path, self.schema)
+        else:
+            self.sink = pa.OSFile(output_path, "wb")
+            self.writer = pa.ipc.new_file(self.sink, self.schema)
+
+    def write_columns(self, columns):
+        n = next(len(value) for value in columns.values() if isinstance(value, np.ndarray))
+        arrays = []
+        for field in self.schema:
+            value = columns[field.name]
+            if pa.types.is_dictionary(field.type):
+                if value not in self.filename_index:
+                    raise ValueError(f"{value} is not in the filenames given to GpxColumnarWriter")
+                indices = pa.array(np.full(n, self.filename_index[value], dtype=np.int32))
+                arrays.append(pa.DictionaryArray.from_arrays(indices, self.filename_dictionary))
+            elif isinstance(value, np.ndarray):
+                arrays.append(pa.array(value, type=field.type, from_pandas=True))
+            else:
+                arrays.append(pa.array(np.full(n, value, dtype=field.type.to_pandas_dtype()), type=field.type))
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self.format == "parquet":
+            self.writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+        self.rows += n
+        return n
+
+    def close(self):
+        self.writer.close()
+        if self.sink is not None:
+            self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_columnar_table(path, columns=None):
+    """
+    Load a table written by GpxColumnarWriter as a pyarrow Table, memory mapping the file.
+    For Feather files the columns point straight into the mapped file, nothing is parsed or copied.
+    """
+    if columnar_format(path) == "parquet":
+        return pq.read_table(path, columns=columns, memory_map=True)
+    table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+    return table.select(columns) if columns else table
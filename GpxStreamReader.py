@@ -0,0 +1,144 @@
+"""
+Streaming GPX track point reader, shared by CalculateGpxPathOnMap.py and GPXtoCSV.py.
+
+gpxpy.parse builds the object tree of the whole file before the first point can be used, a day of 360 camera footage
+gives GPX files of several hundred MB and gigabytes of RAM. This reader walks the file with incremental XML parsing
+(ElementTree.iterparse) and clears every track point once it is read, so memory stays bounded by one point (or one chunk).
+
+iter_track_points(path)        yields (latitude, longitude, elevation, time) tuples, time is a datetime or None.
+iter_point_chunks(path, size)  yields (segment_index, latitudes, longitudes, elevations, times) NumPy arrays,
+                               a chunk never spans two track segments. times are datetime64[ms] wall clock times.
+
+Files that are not in the GPX 1.0/1.1 namespace (exotic exports and extensions) fall back to gpxpy.
+"""
+
+import re
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+GPX_NAMESPACES = ("http://www.topografix.com/GPX/1/1", "http://www.topografix.com/GPX/1/0")
+# +hh:mm / -hh:mm offset at the end of a GPX time string
+UTC_OFFSET = re.compile(r"[+-]\d{2}:?\d{2}$")
+
+
+def parse_gpx_time(time_text):
+    """
+    Convert a GPX time string like 2023-07-31T16:58:55Z into a timezone aware datetime, None if empty.
+    """
+    if not time_text:
+        return None
+    return datetime.fromisoformat(time_text.strip().replace("Z", "+00:00"))
+
+
+def iter_raw_points(gpx_path):
+    """
+    Yield (segment_index, latitude, longitude, elevation, time_text) for every track point of the file.
+    elevation is a float or None, time_text is the ISO time string or None.
+    """
+    context = ET.iterparse(gpx_path, events=("start", "end"))
+    namespace = None
+    segment_index = -1
+    current_segment = None
+    for event, elem in context:
+        if namespace is None:
+            # The first event is the start of the root element, check that it is a GPX document
+            namespace = elem.tag[1:].split("}")[0] if elem.tag.startswith("{") else ""
+            if elem.tag != f"{{{namespace}}}gpx" or namespace not in GPX_NAMESPACES:
+                yield from iter_raw_points_gpxpy(gpx_path)
+                return
+            trkseg_tag = f"{{{namespace}}}trkseg"
+            trkpt_tag = f"{{{namespace}}}trkpt"
+            ele_tag = f"{{{namespace}}}ele"
+            time_tag = f"{{{namespace}}}time"
+            continue
+
+        if event == "start":
+            if elem.tag == trkseg_tag:
+                segment_index += 1
+                current_segment = elem
+        elif elem.tag == trkpt_tag:
+            elevation_text = elem.findtext(ele_tag)
+            yield (segment_index,
+                   float(elem.get("lat")),
+                   float(elem.get("lon")),
+                   float(elevation_text) if elevation_text else None,
+                   elem.findtext(time_tag))
+            # Drop the finished point (and any earlier ones) from the tree, so it does not grow with the file
+            if current_segment is not None:
+                current_segment.clear()
+            else:
+                elem.clear()
+
+
+def iter_raw_points_gpxpy(gpx_path):
+    """
+    Same output as iter_raw_points, read through gpxpy. Loads the whole file, only used as fallback.
+    """
+    import gpxpy
+
+    with open(gpx_path, "r") as gpx_file:
+        gpx = gpxpy.parse(gpx_file)
+    segment_index = -1
+    for track in gpx.tracks:
+        for segment in track.segments:
+            segment_index += 1
+            for point in segment.points:
+                yield (segment_index, point.latitude, point.longitude, point.elevation,
+                       point.time.isoformat() if point.time is not None else None)
+
+
+def iter_track_points(gpx_path):
+    """
+    Yield (latitude, longitude, elevation, time) for every track point, in file order.
+    """
+    for _, latitude, longitude, elevation, time_text in iter_raw_points(gpx_path):
+        yield latitude, longitude, elevation, parse_gpx_time(time_text)
+
+
+def times_to_datetime64(time_texts):
+    """
+    Convert a list of GPX time strings (or None) to a datetime64[ms] array of the wall clock times, NaT for None.
+    Wall clock is the time as written in the file, a UTC offset is dropped without converting, the same as
+    iter_track_points and the datetime.replace(tzinfo=None) of the callers.
+    """
+    import numpy as np
+
+    plain_texts = []
+    for text in time_texts:
+        if not text:
+            plain_texts.append("NaT")
+        elif UTC_OFFSET.search(text.strip()):
+            # NumPy would convert these to UTC (with only a warning), parse them here to keep the wall clock time
+            plain_texts.append(parse_gpx_time(text).replace(tzinfo=None).isoformat())
+        else:
+            plain_texts.append(text.strip().rstrip("Z"))
+    return np.array(plain_texts, dtype="datetime64[ms]")
+
+
+def iter_point_chunks(gpx_path, chunk_size=65536):
+    """
+    Yield (segment_index, latitudes, longitudes, elevations, times) arrays of at most chunk_size points.
+    Missing elevations are NaN, missing times are NaT.
+    """
+    import numpy as np
+
+    def make_chunk(segment_index, latitudes, longitudes, elevations, time_texts):
+        return (segment_index,
+                np.array(latitudes, dtype=np.float64),
+                np.array(longitudes, dtype=np.float64),
+                np.array([np.nan if elevation is None else elevation for elevation in elevations], dtype=np.float64),
+                times_to_datetime64(time_texts))
+
+    chunk_segment = None
+    latitudes, longitudes, elevations, time_texts = [], [], [], []
+    for segment_index, latitude, longitude, elevation, time_text in iter_raw_points(gpx_path):
+        if latitudes and (segment_index != chunk_segment or len(latitudes) >= chunk_size):
+            yield make_chunk(chunk_segment, latitudes, longitudes, elevations, time_texts)
+            latitudes, longitudes, elevations, time_texts = [], [], [], []
+        chunk_segment = segment_index
+        latitudes.append(latitude)
+        longitudes.append(longitude)
+        elevations.append(elevation)
+        time_texts.append(time_text)
+    if latitudes:
+        yield make_chunk(chunk_segment, latitudes, longitudes, elevations, time_texts)
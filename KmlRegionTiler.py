@@ -0,0 +1,182 @@
+"""
+Region based, tiled KML for the KMZ generators (GenerateKmz.py and GenKMZwithRotationFinal.py).
+
+With tens of thousands of photos a single doc.kml with one flat folder of placemarks makes Google Earth
+freeze while it parses the file. The tiled mode builds a quadtree over the photo coordinates instead:
+a tile with more than `capacity` photos is split into four, down to `max_depth`. Every tile is its own KML
+file in the KMZ (tiles/<depth>_<x>_<y>.kml) and is linked from its parent with a NetworkLink whose
+<Region>/<Lod> tells the viewer to load it only when the tile is on screen and at least min_lod_pixels big.
+doc.kml only holds the link to the root tile.
+
+The placemarks are in the leaf tiles, so zooming in loads them area by area. The tile of every photo is
+computed for all points at once with NumPy, level by level, the Python loops only run over the tiles.
+
+The tiles are in the tiles/ folder of the KMZ, so the photos are referenced as ../files/<name> from them.
+"""
+
+import io
+import numpy as np
+
+KML_TILE_HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2" xmlns:kml="http://www.opengis.net/kml/2.2" xmlns:atom="http://www.w3.org/2005/Atom">
+<Document>
+    <name>{name}</name>
+"""
+
+KML_TILE_FOOTER = """
+</Document>
+</kml>
+"""
+
+KML_NETWORK_LINK = """
+    <NetworkLink>
+        <name>{name}</name>{region}
+        <Link>
+            <href>{href}</href>
+            <viewRefreshMode>onRegion</viewRefreshMode>
+        </Link>
+    </NetworkLink>
+"""
+
+KML_REGION = """
+        <Region>
+            <LatLonAltBox>
+                <north>{north}</north>
+                <south>{south}</south>
+                <east>{east}</east>
+                <west>{west}</west>
+            </LatLonAltBox>
+            <Lod>
+                <minLodPixels>{min_lod_pixels}</minLodPixels>
+                <maxLodPixels>-1</maxLodPixels>
+            </Lod>
+        </Region>"""
+
+# Extent in degrees used when all photos share one latitude or longitude
+MIN_EXTENT = 1e-6
+
+
+def quadtree_bounds(latitudes, longitudes):
+    """
+    (west, south, east, north) of the root tile, the bounding box of the points.
+    """
+    west, east = float(np.min(longitudes)), float(np.max(longitudes))
+    south, north = float(np.min(latitudes)), float(np.max(latitudes))
+    if east - west < MIN_EXTENT:
+        west, east = west - MIN_EXTENT / 2, east + MIN_EXTENT / 2
+    if north - south < MIN_EXTENT:
+        south, north = south - MIN_EXTENT / 2, north + MIN_EXTENT / 2
+    return west, south, east, north
+
+
+def assign_tiles(latitudes, longitudes, bounds, capacity=256, max_depth=16):
+    """
+    Return (depths, xs, ys) arrays with the leaf tile of every point. A tile at depth d is cell (x, y)
+    of a 2^d by 2^d grid over bounds, y counted from the south. A tile keeps its points if it has at most
+    capacity of them or is at max_depth, otherwise they move on to the four tiles of the next depth.
+    """
+    if not 0 <= max_depth <= 30:
+        raise ValueError("max_depth must be between 0 and 30")
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    west, south, east, north = bounds
+    depths = np.zeros(len(latitudes), dtype=np.int64)
+    xs = np.zeros(len(latitudes), dtype=np.int64)
+    ys = np.zeros(len(latitudes), dtype=np.int64)
+
+    active = np.arange(len(latitudes))
+    for depth in range(max_depth + 1):
+        if not active.size:
+            break
+        cells = 1 << depth
+        x = np.clip(((longitudes[active] - west) / (east - west) * cells).astype(np.int64), 0, cells - 1)
+        y = np.clip(((latitudes[active] - south) / (north - south) * cells).astype(np.int64), 0, cells - 1)
+        _, inverse, counts = np.unique(x * cells + y, return_inverse=True, return_counts=True)
+        done = (counts[inverse] <= capacity) | (depth == max_depth)
+        finished = active[done]
+        depths[finished] = depth
+        xs[finished] = x[done]
+        ys[finished] = y[done]
+        active = active[~done]
+    return depths, xs, ys
+
+
+def tile_name(depth, x, y):
+    return f"{depth}_{x}_{y}"
+
+
+def tile_bounds(bounds, depth, x, y):
+    """
+    (west, south, east, north) of tile (depth, x, y).
+    """
+    west, south, east, north = bounds
+    width = (east - west) / (1 << depth)
+    height = (north - south) / (1 << depth)
+    return west + x * width, south + y * height, west + (x + 1) * width, south + (y + 1) * height
+
+
+def build_tile_tree(depths, xs, ys):
+    """
+    Return ({leaf tile: point indices}, {tile: child tiles}) for the leaf tiles from assign_tiles.
+    The tree holds every ancestor of the leaves, down from the root tile (0, 0, 0).
+    """
+    order = np.lexsort((ys, xs, depths))
+    keys = np.stack([depths[order], xs[order], ys[order]], axis=1)
+    starts = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+    leaves = {(int(depths[group[0]]), int(xs[group[0]]), int(ys[group[0]])): group for group in np.split(order, starts)}
+
+    children = {}
+    for tile in leaves:
+        depth, x, y = tile
+        while depth > 0:
+            parent = (depth - 1, x >> 1, y >> 1)
+            siblings = children.setdefault(parent, set())
+            already_linked = bool(siblings)
+            siblings.add((depth, x, y))
+            if already_linked:
+                break  # The parent and its ancestors are in the tree already
+            depth, x, y = parent
+    return leaves, {tile: sorted(tile_children) for tile, tile_children in children.items()}
+
+
+def network_link(bounds, tile, href, min_lod_pixels):
+    west, south, east, north = tile_bounds(bounds, *tile)
+    region = KML_REGION.format(north=north, south=south, east=east, west=west, min_lod_pixels=min_lod_pixels)
+    return KML_NETWORK_LINK.format(name=tile_name(*tile), region=region, href=href)
+
+
+def write_tiled_kml(kmz, image_data, write_placemarks, capacity=256, max_depth=16, min_lod_pixels=128,
+                    document_name="photo_data.kmz"):
+    """
+    Write doc.kml and then the tiles of image_data ({image name: (lat, lon, alt)}) into the open KMZ zip.
+    write_placemarks(kml_stream, tile_image_data, src_prefix) writes the placemarks of one tile, with
+    src_prefix ("../") put in front of the photo paths. Returns the number of tile files written.
+    """
+    if not image_data:
+        with io.TextIOWrapper(kmz.open("doc.kml", "w"), encoding="utf-8") as kml_stream:
+            kml_stream.write(KML_TILE_HEADER.format(name=document_name))
+            kml_stream.write(KML_TILE_FOOTER)
+        return 0
+
+    names = list(image_data)
+    latitudes = np.array([image_data[name][0] for name in names], dtype=np.float64)
+    longitudes = np.array([image_data[name][1] for name in names], dtype=np.float64)
+    bounds = quadtree_bounds(latitudes, longitudes)
+    leaves, children = build_tile_tree(*assign_tiles(latitudes, longitudes, bounds, capacity, max_depth))
+
+    # doc.kml goes first: the viewer opens the first .kml entry of a KMZ as the root document.
+    # The root tile is always loaded, its children follow their regions
+    with io.TextIOWrapper(kmz.open("doc.kml", "w"), encoding="utf-8") as kml_stream:
+        kml_stream.write(KML_TILE_HEADER.format(name=document_name))
+        kml_stream.write(KML_NETWORK_LINK.format(name="Photo Points", region="", href=f"tiles/{tile_name(0, 0, 0)}.kml"))
+        kml_stream.write(KML_TILE_FOOTER)
+
+    for tile in sorted(set(leaves) | set(children)):
+        with io.TextIOWrapper(kmz.open(f"tiles/{tile_name(*tile)}.kml", "w"), encoding="utf-8") as kml_stream:
+            kml_stream.write(KML_TILE_HEADER.format(name=tile_name(*tile)))
+            for child in children.get(tile, ()):
+                kml_stream.write(network_link(bounds, child, tile_name(*child) + ".kml", min_lod_pixels))
+            if tile in leaves:
+                write_placemarks(kml_stream, {names[i]: image_data[names[i]] for i in leaves[tile]}, "../")
+            kml_stream.write(KML_TILE_FOOTER)
+    return len(set(leaves) | set(children))
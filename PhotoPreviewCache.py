@@ -0,0 +1,113 @@
+"""
+Preview images for the KMZ generators (GenerateKmz.py and GenKMZwithRotationFinal.py).
+
+The KMZ files embedded the full resolution photos, while the placemark balloon shows them at max-width:1500px anyway,
+which made 10+ GB KMZs that Google Earth loads slowly or can not open. make_preview writes a resized JPEG with
+the given long edge instead, upright (the EXIF orientation is applied), and without the EXIF block.
+
+The JPEG is downscaled with PIL's draft() first, which lets the decoder skip most of the DCT work by decoding
+at 1/2, 1/4 or 1/8 scale, and only the last step is a real resize.
+
+The previews are kept in a content addressed cache folder: the file name is a hash of the whole photo and the
+preview settings, so a rerun reuses every preview that already exists, even after photos were renamed or moved,
+and an edited photo always gets a new preview.
+To keep reruns cheap on network shares the photo is not hashed again while its (path, size, mtime) is unchanged:
+one small pointer file per photo path and preview settings in the stat/ subfolder holds the size, mtime and content
+hash of the last run, and the hash is only reused while the size and mtime still match.
+"""
+
+import os
+import hashlib
+from PIL import Image, ImageOps
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def preview_cache_key(image_path, long_edge, quality):
+    """
+    Content hash of the whole photo and the preview settings.
+    """
+    key = hashlib.sha256()
+    key.update(f"{long_edge},{quality},".encode())
+    with open(image_path, "rb") as image_file:
+        for block in iter(lambda: image_file.read(HASH_BLOCK_SIZE), b""):
+            key.update(block)
+    return key.hexdigest()
+
+
+def stat_pointer_path(image_path, cache_folder, long_edge, quality):
+    """
+    Path of the pointer file of the photo path and the preview settings. It holds "size mtime content hash",
+    so each photo has one pointer that is overwritten when the photo changes.
+    """
+    pointer_key = hashlib.sha256(f"{os.path.abspath(image_path)},{long_edge},{quality}".encode())
+    return os.path.join(cache_folder, "stat", pointer_key.hexdigest() + ".key")
+
+
+def read_pointer(pointer_path, size, mtime):
+    """
+    Content hash from the pointer file, None if it is missing or was written for another size or mtime.
+    """
+    try:
+        with open(pointer_path, "r") as pointer_file:
+            fields = pointer_file.read().split()
+    except OSError:
+        return None
+    if len(fields) != 3 or fields[0] != str(size) or fields[1] != str(mtime):
+        return None
+    return fields[2]
+
+
+def write_atomic(path, text):
+    # Write to a temporary name first, other processes may write the same file at the same time
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as file:
+        file.write(text)
+    os.replace(temp_path, path)
+
+
+def make_preview(image_path, cache_folder, long_edge=1500, quality=85):
+    """
+    Return the path of a JPEG preview of the photo, at most long_edge pixels on its long side.
+    The preview is taken from the cache if it exists, otherwise it is generated and stored there.
+    """
+    stat = os.stat(image_path)
+    pointer_path = stat_pointer_path(image_path, cache_folder, long_edge, quality)
+    pointer = f"{stat.st_size} {stat.st_mtime_ns}"
+    key = read_pointer(pointer_path, stat.st_size, stat.st_mtime_ns)
+    if key:
+        preview_path = os.path.join(cache_folder, key[:2], key + ".jpg")
+        if os.path.exists(preview_path):
+            return preview_path
+
+    key = preview_cache_key(image_path, long_edge, quality)
+    preview_path = os.path.join(cache_folder, key[:2], key + ".jpg")
+    if os.path.exists(preview_path):
+        write_atomic(pointer_path, f"{pointer} {key}")
+        return preview_path
+
+    with Image.open(image_path) as img:
+        # Let the JPEG decoder downscale in the DCT domain, to the smallest scale still at least long_edge
+        img.draft("RGB", (long_edge, long_edge))
+        preview = ImageOps.exif_transpose(img)
+        preview.thumbnail((long_edge, long_edge), Image.LANCZOS)
+        if preview.mode != "RGB":
+            preview = preview.convert("RGB")
+
+        os.makedirs(os.path.dirname(preview_path), exist_ok=True)
+        # Write to a temporary name first, other processes may build the same preview at the same time
+        temp_path = f"{preview_path}.{os.getpid()}.tmp"
+        preview.save(temp_path, format="JPEG", quality=quality)
+    os.replace(temp_path, preview_path)
+    write_atomic(pointer_path, f"{pointer} {key}")
+    return preview_path
+
+
+def preview_arcname(filename):
+    """
+    Name of the preview inside the KMZ: the photo name, with .jpg added for photos that are not JPEGs.
+    """
+    if filename.lower().endswith((".jpg", ".jpeg")):
+        return "files/" + filename
+    return "files/" + filename + ".jpg"
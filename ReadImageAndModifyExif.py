@@ -1,5 +1,7 @@
 from exif import Image
 import os
+import piexif
+from BatchExifStamper import load_text_log_index, stamp_folder, dms_to_rationals, float_to_rational
 
 # This script can open each photo in the photo path, find the matching txt file in the text path.
 # then convert the decimal gps information from the txt file to dms format
@@ -17,8 +19,12 @@ def decimal_to_dms(decimal_degree):
 def read_and_convert_coordinates(file_path):
     with open(file_path, 'r') as file:
         # Read latitude and longitude from the file
-        decimal_latitude = float(file.readline().strip())
-        decimal_longitude = float(file.readline().strip())
+        return convert_coordinate_lines([file.readline(), file.readline()])
+
+# Same conversion for the lines of a txt file that were read already (the batch mode index)
+def convert_coordinate_lines(text_lines):
+    decimal_latitude = float(text_lines[0].strip())
+    decimal_longitude = float(text_lines[1].strip())
 
     # Convert latitude to degrees, minutes, and decimal seconds
     dms_lat = decimal_to_dms(abs(decimal_latitude))
@@ -35,6 +41,10 @@ def read_and_convert_coordinates(file_path):
 absolute_path = os.path.dirname(os.path.abspath(__file__))
 #absolute_path = os.path.dirname(sys.executable)
 
+# True: stamp all photos with BatchExifStamper (txt files read once into an index, only the Exif segment of each photo rewritten,
+# photos processed in a thread pool). False: the older one photo at a time version with the exif library.
+use_batch_stamper = True
+
 # Subfolders for raw images, text files, and modified new images.
 relative_photo_path = "capture"
 relative_txt_path = "Txt_log"
@@ -45,6 +55,20 @@ photos_folder = os.path.join(absolute_path, relative_photo_path)
 text_folder = os.path.join(absolute_path, relative_txt_path)
 new_photo_folder = os.path.join(absolute_path, relative_new_photo_path)
 
+# Tags of one photo for the batch mode, in piexif form
+def build_tags(name, text_lines):
+    dms_lat, lat_ref, dms_long, long_ref = convert_coordinate_lines(text_lines)
+    return {
+        "0th": {piexif.ImageIFD.Make: "Your Camera Make",
+                piexif.ImageIFD.Model: "Your Camera Model"},
+        "GPS": {piexif.GPSIFD.GPSLatitudeRef: lat_ref,
+                piexif.GPSIFD.GPSLongitudeRef: long_ref,
+                piexif.GPSIFD.GPSLatitude: dms_to_rationals(dms_lat),
+                piexif.GPSIFD.GPSLongitude: dms_to_rationals(dms_long),
+                piexif.GPSIFD.GPSAltitude: float_to_rational(50.0),  # in meters, same value for all photos as below
+                piexif.GPSIFD.GPSAltitudeRef: 0},  # 0 means above sea level
+    }
+
 # Create a list of photo filenames along with their creation dates
 photo_files = os.listdir(photos_folder)
 text_files = os.listdir(text_folder)
@@ -54,6 +78,10 @@ text_files = os.listdir(text_folder)
 # List all JPG file in the folder
 jpg_files = [file for file in photo_files if file.endswith('.jpg') and not file.lower().endswith('jpg.meta')]
 
+if use_batch_stamper:
+    stamp_folder(photos_folder, new_photo_folder, load_text_log_index(text_folder, max_lines=2), build_tags, jpg_files)
+    jpg_files = []
+
 for jpg_file in jpg_files:
     jpg_path = os.path.join(photos_folder, jpg_file)
     
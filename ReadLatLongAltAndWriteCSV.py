@@ -7,33 +7,15 @@
 
 
 import os
-from PIL import Image
-from PIL.ExifTags import TAGS, GPSTAGS
+import sys
 import csv
+from ExifHeaderReader import read_photo_info
 
-# Function to convert GPS coordinates from degrees, minutes, seconds to decimal degrees
-def convert_to_decimal_degrees(coord):
-    degrees = coord[0]
-    minutes = coord[1]
-    seconds = coord[2]
-    decimal_degrees = degrees + (minutes / 60.0) + (seconds / 3600.0)
-    return decimal_degrees
-
-# Function to extract GPS data from an image file and convert to decimal degrees
+# Function to extract GPS data from an image file in decimal degrees. Only the Exif header is read (see ExifHeaderReader.py),
+# and the N/S and E/W references give the sign, west and south are "-", east and north have no sign
 def extract_gps_data(image_path):
-    try:
-        with Image.open(image_path) as img:
-            exif_data = img._getexif()
-            if exif_data and 34853 in exif_data:
-                gps_data = exif_data[34853]  # GPSInfo tag
-                latitude = convert_to_decimal_degrees(gps_data[2])  # GPS latitude
-                # Pay attention to the hemisphere, west is "-" east has no sign
-                longitude = -convert_to_decimal_degrees(gps_data[4])  # GPS longitude
-                altitude = gps_data[6] if 6 in gps_data else None  # GPS altitude
-                return latitude, longitude, altitude
-    except Exception as e:
-        print(f"Error processing {image_path}: {e}")
-    return None, None, None
+    info = read_photo_info(image_path)
+    return info["latitude"], info["longitude"], info["altitude"]
 
 # Folder containing your photos  (for builidng executables use this line for folder, and build the script into exe with pyinstaller)
 folder_path = os.path.dirname(sys.executable)
@@ -2,25 +2,78 @@
 # Build this into executable using "pyinstaller --onefile scriptName.py" command.
 # the app will ask user to set a x1,y1,x2,y2 area of the pdf file page ( the origin of x and y are the upper left corner of pdf page, measured in points, 1 in = 72points)
 # the starting page can help user skip the starting blank page.(use the natural page number, staring with 1), internally, the script will handle it and translate to the index starting with 0
-# in the first step, the app will determine if the text area can be directly read out or not ,and choose the correct method to get the text
+# in the first step, the app will determine for each page if the text area can be directly read out or not ,and choose the correct method to get the text
+# ocr results are cached in the "<pdf name>_ocr_cache" folder next to the pdf, so re-running the first step skips every page already ocr-ed
 # text extraced or ocr-ed from pdf page will be stored in the csv file for user to review, 
 # after reviewing and correcting wrong numbers, user can click 2nd step to split the big pdf into smaller files the contains same text (the boring log number).
+# the 2nd step copies page ranges with PyMuPDF in one pass over the pdf (split_pdf_from_csv_streaming), the older PyPDF2 based split_pdf_from_csv is kept for reference.
 
 
 
 
 import os
+import sys
 import csv
+import hashlib
+import time
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
 import fitz  # PyMuPDF
 from PyPDF2 import PdfReader, PdfWriter
 from tkinter import Tk, filedialog, Label, Button, Entry
 
+def read_text_from_page(page, x1, y1, x2, y2):
+    rect = fitz.Rect(x1, y1, x2, y2)
+    return page.get_text('text', clip=rect)
+
+# The page area is rasterized at OCR_ZOOM times 72 dpi before ocr
+OCR_ZOOM = 2
+
+def render_page_area(page, x1, y1, x2, y2):
+    area = (x1, y1, x2, y2)
+    return page.get_pixmap(matrix=fitz.Matrix(OCR_ZOOM, OCR_ZOOM), clip=area)
+
+def ocr_text_from_page(page, x1, y1, x2, y2):
+    return ocr_pixmap(render_page_area(page, x1, y1, x2, y2))
+
+def ocr_pixmap(pixmap):
+    ocr_pdf_document = fitz.open("pdf", pixmap.pdfocr_tobytes(compress=True, language='eng', tessdata=tessdata_path))
+    ocr_page = ocr_pdf_document.load_page(0)
+    text = ocr_page.get_text()
+    ocr_pdf_document.close()
+    return text
+
+# OCR with an on-disk result cache. The key is a hash of the rendered pixels of the clipped area plus the rectangle and dpi,
+# so a page is only ocr-ed again if its content, the region or the resolution changed.
+# Rendering the small area is cheap compared to running Tesseract on it.
+def ocr_text_cached(page, x1, y1, x2, y2, cache_folder):
+    pixmap = render_page_area(page, x1, y1, x2, y2)
+    key = hashlib.sha256(pixmap.samples)
+    key.update(f"{x1},{y1},{x2},{y2},{72 * OCR_ZOOM},{pixmap.width}x{pixmap.height}".encode())
+    digest = key.hexdigest()
+    cache_path = os.path.join(cache_folder, digest[:2], digest + '.txt')
+    if os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as cache_file:
+            return cache_file.read()
+
+    text = ocr_pixmap(pixmap)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # Write to a temporary name first, the parallel workers may finish the same page content at the same time
+    temp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as cache_file:
+        cache_file.write(text)
+    os.replace(temp_path, cache_path)
+    return text
+
+def get_ocr_cache_folder(pdf_path):
+    return os.path.splitext(pdf_path)[0] + '_ocr_cache'
+
 def extract_text_from_location(pdf_path, page_number, x1, y1, x2, y2):
     try:
         pdf_document = fitz.open(pdf_path)
         page = pdf_document.load_page(page_number)
-        rect = fitz.Rect(x1, y1, x2, y2)
-        text = page.get_text('text', clip=rect)
+        text = read_text_from_page(page, x1, y1, x2, y2)
         pdf_document.close()
         return text
     except Exception as e:
@@ -31,19 +84,79 @@ def ocr_part_of_pdf(pdf_path, page_number, x1, y1, x2, y2):
     try:
         pdf_document = fitz.open(pdf_path)
         page = pdf_document.load_page(page_number)
-        area = (x1, y1, x2, y2)
-        pixmap = page.get_pixmap(matrix=fitz.Matrix(2, 2), clip=area)
+        text = ocr_text_from_page(page, x1, y1, x2, y2)
         pdf_document.close()
-        
-        ocr_pdf_document = fitz.open("pdf", pixmap.pdfocr_tobytes(compress=True, language='eng', tessdata=tessdata_path))
-        ocr_page = ocr_pdf_document.load_page(0)
-        text = ocr_page.get_text()
-        ocr_pdf_document.close()
         return text
     except Exception as e:
         print(f"Error during OCR: {e}")
         return ""
 
+# Document-session extraction engine. The PDF is opened once and every page from start_page is read
+# from the same document, instead of reopening the file (and reparsing its xref table) for each page.
+# Yields (page_number, text) with the human-readable page number, so rows can be streamed to the csv.
+# end_page (inclusive, human-readable) limits the walk to a page range, used by the parallel OCR workers.
+# ocr_or_not=None detects the method per page: the text is read directly, and only pages with an empty area are ocr-ed.
+# With a cache_folder, ocr results are looked up in and stored to the on-disk cache (ocr_text_cached).
+def extract_text_in_session(pdf_path, start_page, x1, y1, x2, y2, ocr_or_not, end_page=None, cache_folder=None):
+    pdf_document = fitz.open(pdf_path)
+    try:
+        last_page = pdf_document.page_count if end_page is None else min(end_page, pdf_document.page_count)
+        for i in range(start_page - 1, last_page):
+            page = pdf_document.load_page(i)
+            try:
+                if ocr_or_not:
+                    needs_ocr = True
+                else:
+                    text = read_text_from_page(page, x1, y1, x2, y2)
+                    needs_ocr = ocr_or_not is None and text.strip() == ""
+                if needs_ocr:
+                    if cache_folder:
+                        text = ocr_text_cached(page, x1, y1, x2, y2, cache_folder)
+                    else:
+                        text = ocr_text_from_page(page, x1, y1, x2, y2)
+            except Exception as e:
+                print(f"Error reading page {i + 1}: {e}")
+                text = ""
+            yield i + 1, text
+    finally:
+        pdf_document.close()
+
+def count_pages(pdf_path):
+    pdf_document = fitz.open(pdf_path)
+    page_count = pdf_document.page_count
+    pdf_document.close()
+    return page_count
+
+# Worker for the parallel OCR mode. Runs in its own process, holds its own open document for the
+# given page range and returns the cleaned (page_number, text) rows of that range.
+def ocr_page_range(pdf_path, first_page, last_page, x1, y1, x2, y2, ocr_or_not=True, cache_folder=None):
+    return [(page_number, clean_special_text(text))
+            for page_number, text in extract_text_in_session(pdf_path, first_page, x1, y1, x2, y2, ocr_or_not, last_page, cache_folder)]
+
+# Spread the OCR pages across a process pool in ranges of pages_per_task pages and yield the rows back in page order.
+# If cancel_event gets set, the pending ranges are dropped and the generator stops early.
+def ocr_pages_in_parallel(pdf_path, start_page, x1, y1, x2, y2, workers, cancel_event=None, pages_per_task=20,
+                          ocr_or_not=True, cache_folder=None):
+    total_pages = count_pages(pdf_path)
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [executor.submit(ocr_page_range, pdf_path, first_page, min(first_page + pages_per_task - 1, total_pages), x1, y1, x2, y2,
+                                   ocr_or_not, cache_folder)
+                   for first_page in range(start_page, total_pages + 1, pages_per_task)]
+        for future in futures:
+            while True:
+                if cancel_event is not None and cancel_event.is_set():
+                    return
+                try:
+                    rows = future.result(timeout=0.2)
+                    break
+                except FutureTimeoutError:
+                    continue
+            for row in rows:
+                yield row
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
 def determine_type(pdf_path, page_number, x1, y1, x2, y2):
     test_text = extract_text_from_location(pdf_path, page_number, x1, y1, x2, y2)
     if test_text != "":
@@ -51,28 +164,68 @@ def determine_type(pdf_path, page_number, x1, y1, x2, y2):
     else: 
         return True
 
-def generate_csv(pdf_path, start_page, x1, y1, x2, y2, ocr_or_not):
+# use_session=True reads all pages through one open document (extract_text_in_session),
+# use_session=False keeps the old open-per-page path, so the pages/s printed at the end can be compared.
+# ocr_or_not=None detects text or OCR per page, and ocr results go through the on-disk cache of the pdf (get_ocr_cache_folder).
+# With workers > 1, OCR pages are spread across a process pool (ocr_pages_in_parallel), rows still come out in page order.
+# The rows are written to a .part file that only replaces the csv once every page is done, so a cancelled run
+# (cancel_event set from the GUI) or a failed one leaves no half-written csv behind. Returns None when cancelled.
+def generate_csv(pdf_path, start_page, x1, y1, x2, y2, ocr_or_not, use_session=True, workers=1, cancel_event=None):
     csv_path = os.path.splitext(pdf_path)[0] + '.csv'
-    with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-        csv_writer = csv.writer(csvfile)
-        csv_writer.writerow(['Page Number', 'Extracted Text'])
-        
-        with open(pdf_path, 'rb') as input_file:
-            pdf_reader = PdfReader(input_file)
-            total_pages = len(pdf_reader.pages)        
-            
-            if ocr_or_not:
-                for i in range(start_page - 1, total_pages):
-                    ocr_text = ocr_part_of_pdf(pdf_path, i, x1, y1, x2, y2)
-                    ocr_clean_text = clean_special_text(ocr_text)
-                    csv_writer.writerow([i + 1, ocr_clean_text])  # Adjust for human-readable page numbering
+    cache_folder = get_ocr_cache_folder(pdf_path)
+    part_path = csv_path + '.part'
+    start_time = time.perf_counter()
+    pages_done = 0
+    cancelled = False
+    try:
+        with open(part_path, 'w', newline='', encoding='utf-8') as csvfile:
+            csv_writer = csv.writer(csvfile)
+            csv_writer.writerow(['Page Number', 'Extracted Text'])
+
+            if ocr_or_not is not False and workers > 1:
+                for page_number, clean_text in ocr_pages_in_parallel(pdf_path, start_page, x1, y1, x2, y2, workers, cancel_event,
+                                                                     ocr_or_not=ocr_or_not, cache_folder=cache_folder):
+                    csv_writer.writerow([page_number, clean_text])
+                    pages_done += 1
+            elif use_session:
+                for page_number, text in extract_text_in_session(pdf_path, start_page, x1, y1, x2, y2, ocr_or_not, cache_folder=cache_folder):
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    csv_writer.writerow([page_number, clean_special_text(text)])
+                    pages_done += 1
             else:
-                for i in range(start_page - 1, total_pages):
-                    read_text = extract_text_from_location(pdf_path, i, x1, y1, x2, y2)
-                    read_clean_text = clean_special_text(read_text)
-                    csv_writer.writerow([i + 1, read_clean_text])  # Adjust for human-readable page numbering
-    
-    button2.config(state="normal")  # Enable the split file button once CSV is written
+                with open(pdf_path, 'rb') as input_file:
+                    pdf_reader = PdfReader(input_file)
+                    total_pages = len(pdf_reader.pages)        
+                
+                    if ocr_or_not:
+                        for i in range(start_page - 1, total_pages):
+                            ocr_text = ocr_part_of_pdf(pdf_path, i, x1, y1, x2, y2)
+                            ocr_clean_text = clean_special_text(ocr_text)
+                            csv_writer.writerow([i + 1, ocr_clean_text])  # Adjust for human-readable page numbering
+                            pages_done += 1
+                    else:
+                        for i in range(start_page - 1, total_pages):
+                            read_text = extract_text_from_location(pdf_path, i, x1, y1, x2, y2)
+                            read_clean_text = clean_special_text(read_text)
+                            csv_writer.writerow([i + 1, read_clean_text])  # Adjust for human-readable page numbering
+                            pages_done += 1
+            cancelled = cancel_event is not None and cancel_event.is_set()
+    except BaseException:
+        # An error in the OCR workers, the PDF reader or the fitz session (or Ctrl+C) leaves no half-written file either
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+    if cancelled:
+        os.remove(part_path)
+        print(f"Cancelled after {pages_done} pages, no csv written")
+        return None
+    os.replace(part_path, csv_path)
+
+    elapsed = time.perf_counter() - start_time
+    pages_per_second = pages_done / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {pages_done} pages in {elapsed:.1f} s ({pages_per_second:.1f} pages/s)")
     return csv_path                
 
 def split_pdf_from_csv(pdf_path, csv_path, output_folder):
@@ -116,6 +269,83 @@ def split_pdf_from_csv(pdf_path, csv_path, output_folder):
     except Exception as e:
         print(f"Error splitting PDF: {e}")
 
+# Streaming splitter backend. Walks the csv once and emits every section as soon as its text changes,
+# copying the page ranges with PyMuPDF insert_pdf from the source document that stays open for the whole run.
+# Only one output document is held in memory at a time, and garbage collection on save merges the duplicated
+# objects (fonts, images) that the page copies share, so every output carries one copy of each.
+# Prints the total bytes written and the peak resident memory of the process.
+def split_pdf_from_csv_streaming(pdf_path, csv_path, output_folder):
+    try:
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
+        base_name = os.path.splitext(os.path.basename(pdf_path))[0]
+        start_time = time.perf_counter()
+        total_bytes = 0
+        section_count = 0
+
+        def write_section(section_text, page_numbers):
+            output_pdf_path = os.path.join(output_folder, f'{base_name}_{section_text}.pdf')
+            output_document = fitz.open()
+            # Copy runs of consecutive pages as one range, rows deleted from the csv just break the run
+            run_start = previous = page_numbers[0]
+            for page_number in page_numbers[1:] + [None]:
+                if page_number != previous + 1:
+                    output_document.insert_pdf(source_document, from_page=run_start, to_page=previous)
+                    run_start = page_number
+                previous = page_number
+            output_document.save(output_pdf_path, garbage=3, deflate=True)
+            output_document.close()
+            return os.path.getsize(output_pdf_path)
+
+        source_document = fitz.open(pdf_path)
+        try:
+            with open(csv_path, 'r', newline='', encoding='utf-8') as csvfile:
+                csv_reader = csv.reader(csvfile)
+                next(csv_reader)
+                current_special_text = ''
+                current_section_pages = []
+
+                for row in csv_reader:
+                    page_number, text = row
+                    page_number = int(page_number) - 1  # Convert back to zero-indexed page number
+                    clean_text = clean_special_text(text)
+
+                    if clean_text != current_special_text and current_section_pages:
+                        total_bytes += write_section(current_special_text, current_section_pages)
+                        section_count += 1
+                        current_section_pages = []
+                    current_special_text = clean_text
+                    current_section_pages.append(page_number)
+
+                if current_section_pages:
+                    total_bytes += write_section(current_special_text, current_section_pages)
+                    section_count += 1
+        finally:
+            source_document.close()
+
+        elapsed = time.perf_counter() - start_time
+        peak_rss = get_peak_rss_mb()
+        peak_rss_text = f"{peak_rss:.1f} MB" if peak_rss is not None else "n/a"
+        print(f"Wrote {section_count} files, {total_bytes / 1024 / 1024:.1f} MB in total, in {elapsed:.1f} s (peak RSS {peak_rss_text})")
+    except Exception as e:
+        print(f"Error splitting PDF: {e}")
+
+# Peak resident memory of this process in MB, None if it can not be read on this platform
+def get_peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        memory_info = psutil.Process().memory_info()
+        return getattr(memory_info, 'peak_wset', memory_info.rss) / 1024 / 1024
+    except ImportError:
+        return None
+
 def clean_special_text(text):
     invalid_chars = '\\/:*?"<>|,'
     for char in invalid_chars:
@@ -123,10 +353,10 @@ def clean_special_text(text):
     text = text.strip()
     return text
 
-def generate_csv_and_run(pdf_path, start_page, x1, y1, x2, y2):
-    button2.config(state="disabled")  # Disable the split file button
-    ocr_or_not = determine_type(pdf_path, start_page - 1, x1, y1, x2, y2)
-    generate_csv(pdf_path, start_page, x1, y1, x2, y2, ocr_or_not)
+# The text or OCR method is detected per page (ocr_or_not=None). determine_type can still be used to force
+# one method for the whole file based on the start page.
+def generate_csv_and_run(pdf_path, start_page, x1, y1, x2, y2, workers=1, cancel_event=None):
+    return generate_csv(pdf_path, start_page, x1, y1, x2, y2, None, workers=workers, cancel_event=cancel_event)
 
 def select_pdf_file():
     root = Tk()
@@ -148,12 +378,37 @@ def run_1st_step():
         y1 = int(entry_y1.get())
         x2 = int(entry_x2.get())
         y2 = int(entry_y2.get())
-        generate_csv_and_run(pdf_path, start_page, x1, y1, x2, y2)
+        workers = max(1, int(entry_workers.get()))
+        button1.config(state="disabled")
+        button2.config(state="disabled")  # Disable the split file button
+        button_cancel.config(state="normal")
+        cancel_event.clear()
+
+        # Step 1 runs in a background thread so the window stays responsive and the Cancel button works.
+        step1_result = {}
+        def step1_worker():
+            step1_result['csv_path'] = generate_csv_and_run(pdf_path, start_page, x1, y1, x2, y2, workers, cancel_event)
+        thread = threading.Thread(target=step1_worker, daemon=True)
+        thread.start()
+        root.after(200, check_1st_step, thread, step1_result)
+
+# Poll the step 1 thread from the Tk main loop, and update the buttons once it is finished.
+def check_1st_step(thread, step1_result):
+    if thread.is_alive():
+        root.after(200, check_1st_step, thread, step1_result)
+        return
+    button1.config(state="normal")
+    button_cancel.config(state="disabled")
+    if step1_result.get('csv_path'):
+        button2.config(state="normal")  # Enable the split file button once CSV is written
+
+def cancel_1st_step():
+    cancel_event.set()
 
 def run_2nd_step():
     csv_path = select_csv_file()
     output_folder = os.path.splitext(csv_path)[0] + '_output'
-    split_pdf_from_csv(os.path.splitext(csv_path)[0] + '.pdf', csv_path, output_folder)
+    split_pdf_from_csv_streaming(os.path.splitext(csv_path)[0] + '.pdf', csv_path, output_folder)
 
 def load_settings():
     settings_file = 'settings.txt'
@@ -178,50 +433,65 @@ folder_path = os.path.dirname(os.path.abspath(sys.executable))
 
 tessdata_path = os.path.join(folder_path, "tessdata")
 
-# Create GUI main window
-root = Tk()
-root.title("Boring Log Splitting Tool")
-
-label1 = Label(root, text="Step 1: Select PDF file and Set Coordinates")
-label1.pack()
-
-label_start_page = Label(root, text="Starting Page Number:")
-label_start_page.pack()
-entry_start_page = Entry(root)
-entry_start_page.pack()
-entry_start_page.insert(0, "1")
-
-label_x1 = Label(root, text="x1:")
-label_x1.pack()
-entry_x1 = Entry(root)
-entry_x1.pack()
-entry_x1.insert(0, str(x1_default))
-
-label_y1 = Label(root, text="y1:")
-label_y1.pack()
-entry_y1 = Entry(root)
-entry_y1.pack()
-entry_y1.insert(0, str(y1_default))
-
-label_x2 = Label(root, text="x2:")
-label_x2.pack()
-entry_x2 = Entry(root)
-entry_x2.pack()
-entry_x2.insert(0, str(x2_default))
-
-label_y2 = Label(root, text="y2:")
-label_y2.pack()
-entry_y2 = Entry(root)
-entry_y2.pack()
-entry_y2.insert(0, str(y2_default))
-
-button1 = Button(root, text="Select PDF and Generate CSV", command=run_1st_step)
-button1.pack()
-
-label2 = Label(root, text="Step 2: Inspect and Correct CSV File, then click Split File")
-label2.pack()
-
-button2 = Button(root, text="Split File", command=run_2nd_step, state="disabled")
-button2.pack()
-
-root.mainloop()
+if __name__ == "__main__":
+    # Needed for the OCR process pool in the pyinstaller built executable
+    multiprocessing.freeze_support()
+    cancel_event = threading.Event()
+
+    # Create GUI main window
+    root = Tk()
+    root.title("Boring Log Splitting Tool")
+
+    label1 = Label(root, text="Step 1: Select PDF file and Set Coordinates")
+    label1.pack()
+
+    label_start_page = Label(root, text="Starting Page Number:")
+    label_start_page.pack()
+    entry_start_page = Entry(root)
+    entry_start_page.pack()
+    entry_start_page.insert(0, "1")
+
+    label_x1 = Label(root, text="x1:")
+    label_x1.pack()
+    entry_x1 = Entry(root)
+    entry_x1.pack()
+    entry_x1.insert(0, str(x1_default))
+
+    label_y1 = Label(root, text="y1:")
+    label_y1.pack()
+    entry_y1 = Entry(root)
+    entry_y1.pack()
+    entry_y1.insert(0, str(y1_default))
+
+    label_x2 = Label(root, text="x2:")
+    label_x2.pack()
+    entry_x2 = Entry(root)
+    entry_x2.pack()
+    entry_x2.insert(0, str(x2_default))
+
+    label_y2 = Label(root, text="y2:")
+    label_y2.pack()
+    entry_y2 = Entry(root)
+    entry_y2.pack()
+    entry_y2.insert(0, str(y2_default))
+
+    # Number of processes used when the pages need OCR
+    label_workers = Label(root, text="OCR Workers:")
+    label_workers.pack()
+    entry_workers = Entry(root)
+    entry_workers.pack()
+    entry_workers.insert(0, str(os.cpu_count() or 1))
+
+    button1 = Button(root, text="Select PDF and Generate CSV", command=run_1st_step)
+    button1.pack()
+
+    button_cancel = Button(root, text="Cancel", command=cancel_1st_step, state="disabled")
+    button_cancel.pack()
+
+    label2 = Label(root, text="Step 2: Inspect and Correct CSV File, then click Split File")
+    label2.pack()
+
+    button2 = Button(root, text="Split File", command=run_2nd_step, state="disabled")
+    button2.pack()
+
+    root.mainloop()
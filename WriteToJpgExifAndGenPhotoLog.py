@@ -2,14 +2,22 @@ import os
 import re
 import sys
 import time
+from copy import deepcopy
 from datetime import datetime
 from docx import Document
 from docx.shared import Inches
 from docx.shared import Pt
 from io import BytesIO
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.oxml.shape import CT_Inline
 from PIL import Image as PILImage
+from PIL import ImageOps
 from exif import Image as ExifImage
+import piexif
+import piexif.helper
+from BatchExifStamper import load_text_log_index, stamp_folder, dms_to_rationals, float_to_rational
 
 
 """
@@ -45,18 +53,21 @@ def decimal_to_dms(decimal_degree):
 def read_and_convert_coordinates(file_path):
     with open(file_path, 'r') as file:
         # Read latitude and longitude from the file
-        decimal_latitude = float(file.readline().strip())
-        decimal_longitude = float(file.readline().strip())
-        altitude_in_meter = float(file.readline().strip())
-        timestamp = str(file.readline().strip())
-        direction = str(file.readline().strip())
-        no_use = str(file.readline().strip())
-        description = str(file.readline().strip())
-        
-        direction = direction[30:33]
-        direction_numberic_part = ''.join(filter(str.isdigit, direction))
-        direction = direction_numberic_part
-        
+        return convert_text_lines([file.readline() for _ in range(7)])
+
+# Same conversion for the lines of a txt file that were read already (the batch mode index)
+def convert_text_lines(text_lines):
+    decimal_latitude = float(text_lines[0].strip())
+    decimal_longitude = float(text_lines[1].strip())
+    altitude_in_meter = float(text_lines[2].strip())
+    timestamp = str(text_lines[3].strip())
+    direction = str(text_lines[4].strip())
+    no_use = str(text_lines[5].strip())
+    description = str(text_lines[6].strip())
+
+    direction = direction[30:33]
+    direction_numberic_part = ''.join(filter(str.isdigit, direction))
+    direction = direction_numberic_part
 
     # Convert latitude to degrees, minutes, and decimal seconds
     dms_lat = decimal_to_dms(abs(decimal_latitude))
@@ -68,6 +79,77 @@ def read_and_convert_coordinates(file_path):
 
     return dms_lat, lat_ref, dms_long, long_ref, altitude_in_meter, timestamp, direction, description
 
+# Decode a photo once, at the resolution it is printed with (width_inches at dpi), and return it as an in-memory JPEG for add_picture.
+# draft() lets the JPEG decoder scale down by 1/2, 1/4 or 1/8 while decoding, the rest is a normal resize.
+def downsample_photo(photo_path, width_inches=6, dpi=200, quality=85):
+    target_width = int(width_inches * dpi)
+    with PILImage.open(photo_path) as img:
+        img.draft("RGB", (target_width, target_width))
+        img = ImageOps.exif_transpose(img)
+        if img.width > target_width:
+            img = img.resize((target_width, max(1, round(img.height * target_width / img.width))), PILImage.LANCZOS)
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        stream = BytesIO()
+        img.save(stream, format="JPEG", quality=quality, dpi=(dpi, dpi))
+    stream.seek(0)
+    return stream
+
+# Build the photo table once, the same way the loop below builds it for every photo, with placeholders for the texts
+# and the photo. The table is taken out of the document again and returned as an XML element to copy with add_photo_table.
+def build_photo_table_template(doc):
+    table = doc.add_table(3,3, style='Table Grid')
+    table.columns[0].width = Inches(0.84)
+    table.columns[1].width = Inches(0.84)
+    table.columns[1].width = Inches(5.83)
+    A = table.cell(1,0).merge(table.cell(1,1))
+    B = table.cell(2,0).merge(table.cell(2,1))
+    A.text = "{direction}"
+    B.text = "{description}"
+    table.cell(0,0).text = "Date" + "\n" + "{date}"
+    table.cell(0,0).paragraphs[0].runs[0].font.size = Pt(8)
+    table.cell(0,1).text = "Photo"+ "\n"  "No." + "{photo_no}"
+    table.cell(0,1).paragraphs[0].runs[0].font.size = Pt(8)
+    table.cell(0,2).merge(table.cell(2,2))
+    paragraph = table.cell(1,2).paragraphs[0]
+    paragraph.add_run("\n")
+    paragraph.add_run("{photo}")
+    paragraph.add_run("\n")
+    paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    tbl = table._tbl
+    tbl.getparent().remove(tbl)
+    return tbl
+
+# Add a copy of the template table to the end of the document body (before the section properties), with the placeholders
+# in values replaced and the picture (path or file object) in place of {photo}. shape_id has to be unique in the document,
+# the caller counts it up instead of python-docx searching the whole document for the largest id on every picture.
+def add_photo_table(doc, template, values, picture, width, shape_id):
+    tbl = deepcopy(template)
+    for text_element in list(tbl.iter(qn('w:t'))):
+        if text_element.text == "{photo}":
+            rId, image = doc.part.get_or_add_image(picture)
+            cx, cy = image.scaled_dimensions(width, None)
+            drawing = OxmlElement('w:drawing')
+            drawing.append(CT_Inline.new_pic_inline(shape_id, rId, image.filename, cx, cy))
+            run = text_element.getparent()
+            run.remove(text_element)
+            run.append(drawing)
+        elif text_element.text and "{" in text_element.text:
+            text = text_element.text
+            for placeholder, value in values.items():
+                text = text.replace(placeholder, value)
+            text_element.text = text
+            text_element.set(qn('xml:space'), 'preserve')
+
+    body = doc.element.body
+    sectPr = body.find(qn('w:sectPr'))
+    if sectPr is not None:
+        sectPr.addprevious(tbl)
+    else:
+        body.append(tbl)
+    return tbl
+
 
 
 
@@ -91,6 +173,21 @@ relative_photo_path = "capture"
 relative_txt_path = "Txt_log"
 relative_new_photo_path = "new_photo"
 
+# True: stamp all photos with BatchExifStamper (txt files read once into an index, only the Exif segment of each photo rewritten,
+# photos processed in a thread pool). False: the older one photo at a time version with the exif library.
+use_batch_stamper = True
+
+# True: use the txt lines read for the batch stamping (every txt file read once), and embed each photo downsampled to the
+# printed size (photo_width_inches at photo_dpi) from an in-memory buffer instead of the full resolution original.
+# False: read each txt file again and embed the original photos.
+downsample_photos = True
+photo_dpi = 200
+photo_width_inches = 6
+
+# True: build the photo table once and copy it for each photo (add_photo_table), instead of creating, merging and
+# filling a new table through python-docx for each photo. The result is the same table.
+use_table_template = True
+
 photos_folder = os.path.join(absolute_path, relative_photo_path)
 text_folder = os.path.join(absolute_path,relative_txt_path)
 new_photo_folder = os.path.join(absolute_path, relative_new_photo_path)
@@ -107,6 +204,36 @@ text_files = os.listdir(text_folder)
 # List all JPG file in the folder
 jpg_files = [file for file in photo_files if file.endswith('.jpg') and not file.lower().endswith('jpg.meta')]
 
+# Tags of one photo for the batch mode, in piexif form, the same values as the loop below writes
+def build_tags(name, text_lines):
+    dms_lat, lat_ref, dms_long, long_ref, altitude_in_meter, timestamp, direction, description = convert_text_lines(text_lines)
+    exif_timestamp = timestamp[0:4] +":" + timestamp[5:7] +":" + timestamp[8:10] + " " +timestamp[11:13] + ":"+ timestamp[14:16] + ":"+ timestamp[17:19]
+    gps_tags = {piexif.GPSIFD.GPSLatitudeRef: lat_ref,
+                piexif.GPSIFD.GPSLongitudeRef: long_ref,
+                piexif.GPSIFD.GPSLatitude: dms_to_rationals(dms_lat),
+                piexif.GPSIFD.GPSLongitude: dms_to_rationals(dms_long),
+                piexif.GPSIFD.GPSAltitude: float_to_rational(altitude_in_meter),
+                piexif.GPSIFD.GPSAltitudeRef: 0,
+                piexif.GPSIFD.GPSDateStamp: timestamp[0:10],
+                piexif.GPSIFD.GPSImgDirectionRef: "T"}
+    if direction:
+        gps_tags[piexif.GPSIFD.GPSImgDirection] = float_to_rational(float(direction))
+    return {
+        "0th": {piexif.ImageIFD.Make: "Your Camera Make",
+                piexif.ImageIFD.Model: "Your Camera Model",
+                piexif.ImageIFD.DateTime: exif_timestamp},
+        "Exif": {piexif.ExifIFD.DateTimeOriginal: exif_timestamp,
+                 piexif.ExifIFD.UserComment: piexif.helper.UserComment.dump(description, encoding="unicode")},
+        "GPS": gps_tags,
+    }
+
+# The first 7 lines of every txt file, read once for the stamping and the docx
+text_index = load_text_log_index(text_folder, max_lines=7) if use_batch_stamper or downsample_photos else None
+
+if use_batch_stamper:
+    stamp_folder(photos_folder, new_photo_folder, text_index, build_tags, jpg_files)
+    jpg_files = []
+
 for jpg_file in jpg_files:
     jpg_path = os.path.join(photos_folder, jpg_file)
     
@@ -188,6 +315,10 @@ section.bottom_margin = bottom_margin
 #doc.add_paragraph('    ')
 
 
+if use_table_template:
+    photo_table_template = build_photo_table_template(doc)
+    next_shape_id = doc.part.next_id
+
 # Add photos to the document, photos_per_page is used to split the pages for every two photo
 photos_per_page = 2
 for i in range(0, len(photo_info), photos_per_page):
@@ -200,10 +331,33 @@ for i in range(0, len(photo_info), photos_per_page):
             # Read the photo file name from photo_info, throw out useless part
             photo_filename, _ = photo_info[idx]
             photo_path = os.path.join(photos_folder, photo_filename)
-            img = PILImage.open(photo_path)
             # Make this image into a thumbnail. This method modifies the image to contain a thumbnail version of itself, no larger than the given size. Not needed for writing in word file
             #img.thumbnail((Inches(6), Inches(6)))
             
+            # Read the corresponding text file,  " text_lines = text_file.read().splitlines()[:7]" means select first 7 lines
+            if downsample_photos:
+                text_lines = text_index[os.path.splitext(photo_filename)[0]]
+            else:
+                text_filename = os.path.splitext(photo_filename)[0] + '.txt'
+                text_path = os.path.join(text_folder, text_filename)
+                with open(text_path, 'r') as text_file:
+                    text_lines = text_file.read().splitlines()[:7]   
+
+            if use_table_template:
+                timestamp_text = text_lines[3]
+                values = {"{direction}": text_lines[4],
+                          "{description}": f"{text_lines[5]} {text_lines[6]}",
+                          "{date}": timestamp_text[5:7]+"/"+timestamp_text[8:10]+"/"+timestamp_text[0:4],
+                          "{photo_no}": str(idx +1)}
+                if downsample_photos:
+                    add_photo_table(doc, photo_table_template, values, downsample_photo(photo_path, photo_width_inches, photo_dpi),
+                                    Inches(photo_width_inches), next_shape_id)
+                else:
+                    add_photo_table(doc, photo_table_template, values, photo_path, Inches(6), next_shape_id)
+                next_shape_id += 1
+                doc.add_paragraph('    ')
+                continue
+
             # Create tables and merge certain cells to hold photo. Refer to python docx documentation for how to merge cells
             table = doc.add_table(3,3, style='Table Grid')
 
@@ -227,12 +381,6 @@ for i in range(0, len(photo_info), photos_per_page):
             d = table.cell(2,1)
             B = c.merge(d)
             
-            # Read the corresponding text file,  " text_lines = text_file.read().splitlines()[:7]" means select first 7 lines
-            text_filename = os.path.splitext(photo_filename)[0] + '.txt'
-            text_path = os.path.join(text_folder, text_filename)
-            with open(text_path, 'r') as text_file:
-                text_lines = text_file.read().splitlines()[:7]   
-                
             # Populate the table cells with text from the txt file. The first is an example for writing one line in txt into a cell in the table. 
             # The second line is an example for writing two line in txt into the same cell
             A.text = text_lines[4]
@@ -260,7 +408,10 @@ for i in range(0, len(photo_info), photos_per_page):
             # To match the format, add empty run in the photo cell before inserting the photo. The photo width is set to 6 inches.
             paragraph = table.cell(1,2).paragraphs[0]
             paragraph.add_run("\n")
-            paragraph.add_run().add_picture(photo_path, width = Inches(6))
+            if downsample_photos:
+                paragraph.add_run().add_picture(downsample_photo(photo_path, photo_width_inches, photo_dpi), width = Inches(photo_width_inches))
+            else:
+                paragraph.add_run().add_picture(photo_path, width = Inches(6))
             paragraph.add_run("\n")
             paragraph.alignment = WD_ALIGN_PARAGRAPH.CENTER
             